@@ -13,6 +13,7 @@ from database.schema import (
     SaleOrder,
     SaleOrderItem,
     StockMovement,
+    DailyProductSales,
 )
 
 __all__ = [
@@ -27,4 +28,5 @@ __all__ = [
     'SaleOrder',
     'SaleOrderItem',
     'StockMovement',
+    'DailyProductSales',
 ]
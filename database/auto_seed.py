@@ -7,7 +7,7 @@ If not, it automatically generates the fake data.
 
 import os
 from pathlib import Path
-from database.connection import SessionLocal
+from database.connection import SessionLocal, create_missing_indexes
 from database.schema import Product
 
 
@@ -46,6 +46,9 @@ def auto_seed_if_needed(force: bool = False, verbose: bool = True) -> bool:
         True if seeding was performed, False if skipped
     """
     if not force and check_database_exists():
+        # Databases created by an older version still need newer tables
+        # (e.g. the rollups) and indexes
+        create_missing_indexes()
         if verbose:
             print("✅ Database already exists and has data. Skipping seed.")
         return False
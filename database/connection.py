@@ -58,13 +58,33 @@ def init_db():
     # Import all models to ensure they're registered
     from database.schema import (
         Product, Supplier, PurchaseOrder, PurchaseOrderItem,
-        SaleOrder, SaleOrderItem, StockMovement
+        SaleOrder, SaleOrderItem, StockMovement, DailyProductSales
     )
     
     Base.metadata.create_all(bind=engine)
+    create_missing_indexes()
     print(f"✅ Database initialized: {DATABASE_URL}")
 
 
+def create_missing_indexes():
+    """
+    Create tables and indexes added to the models after the database was created.
+    
+    create_all() skips existing tables together with their indexes, so
+    databases created by an older version get them here (new tables such
+    as the rollups are created first). Statistics are refreshed afterwards
+    so the query planner picks them up.
+    """
+    Base.metadata.create_all(bind=engine)
+    
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    
+    with engine.begin() as connection:
+        connection.exec_driver_sql('ANALYZE')
+
+
 def drop_all_tables():
     """
     Drop all tables from database.
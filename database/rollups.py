@@ -0,0 +1,140 @@
+"""
+Derived rollup tables for the analysis tools.
+
+SQLite has no materialized views, so aggregates that several tools read
+repeatedly are stored in plain tables and rebuilt from the source tables:
+- daily_product_sales: paid sales per (product, day)
+
+Rollups are rebuilt after seeding and at most once per day per process
+on first use. Code that changes products, sales or stock should call
+refresh_rollups() afterwards. The tables are created on the first
+rebuild if missing, so databases created before the rollups existed
+keep working. Schedule a nightly refresh for long-running deployments:
+
+Usage:
+    python -m database.rollups
+"""
+
+import threading
+from datetime import date
+from typing import Callable, List, Optional
+from sqlalchemy import func, insert, delete, select
+from sqlalchemy.orm import Session
+
+from database.connection import SessionLocal, engine, create_missing_indexes
+from database.schema import SaleOrder, SaleOrderItem, DailyProductSales
+
+# Date of the last rebuild done by this process
+_last_refresh: Optional[date] = None
+
+# Serializes rebuilds, since tools running in threads can all trigger one
+_refresh_lock = threading.Lock()
+
+# Called after refresh_rollups(), e.g. to drop results cached from old data
+_refresh_callbacks: List[Callable[[], None]] = []
+
+
+def refresh_daily_product_sales(session: Optional[Session] = None) -> int:
+    """
+    Rebuild the daily_product_sales rollup from paid sales.
+    
+    Args:
+        session: Optional session to run in (default: a new one, committed)
+    
+    Returns:
+        Number of (product, day) rows written
+    """
+    own_session = session is None
+    if own_session:
+        session = SessionLocal()
+    
+    try:
+        rollup = select(
+            SaleOrderItem.product_id,
+            SaleOrder.sale_date,
+            func.sum(SaleOrderItem.quantity * SaleOrderItem.unit_price),
+            func.sum(SaleOrderItem.quantity),
+            func.count(func.distinct(SaleOrder.id)),
+            func.count(SaleOrderItem.id)
+        ).join(
+            SaleOrder, SaleOrderItem.sale_order_id == SaleOrder.id
+        ).where(
+            SaleOrder.status == 'PAID'
+        ).group_by(
+            SaleOrderItem.product_id,
+            SaleOrder.sale_date
+        )
+        
+        session.execute(delete(DailyProductSales))
+        result = session.execute(
+            insert(DailyProductSales).from_select(
+                ['product_id', 'sale_date', 'revenue', 'quantity', 'order_count', 'item_count'],
+                rollup
+            )
+        )
+        
+        if own_session:
+            session.commit()
+        
+        return result.rowcount
+        
+    finally:
+        if own_session:
+            session.close()
+
+
+def refresh_rollups(session: Optional[Session] = None):
+    """
+    Rebuild every rollup table, then run the on_rollups_refreshed()
+    callbacks.
+    
+    Args:
+        session: Optional session to run in (default: new ones, committed)
+    """
+    with _refresh_lock:
+        _refresh_all(session)
+    
+    for callback in _refresh_callbacks:
+        callback()
+
+
+def on_rollups_refreshed(callback: Callable[[], None]) -> Callable[[], None]:
+    """
+    Register a callback to run after every refresh_rollups().
+    
+    Args:
+        callback: Function called without arguments
+    
+    Returns:
+        The callback, so this can be used as a decorator
+    """
+    _refresh_callbacks.append(callback)
+    return callback
+
+
+def ensure_rollups_fresh():
+    """Rebuild the rollups unless this process already did so today."""
+    if _last_refresh == date.today():
+        return
+    
+    with _refresh_lock:
+        # Another thread may have rebuilt them while this one waited
+        if _last_refresh != date.today():
+            _refresh_all()
+
+
+def _refresh_all(session: Optional[Session] = None):
+    """Rebuild every rollup table; the caller holds _refresh_lock."""
+    global _last_refresh
+    
+    bind = engine if session is None else session.connection()
+    DailyProductSales.__table__.create(bind=bind, checkfirst=True)
+    
+    refresh_daily_product_sales(session)
+    _last_refresh = date.today()
+
+
+if __name__ == "__main__":
+    create_missing_indexes()
+    rows = refresh_daily_product_sales()
+    print(f"✅ daily_product_sales refreshed: {rows} rows")
@@ -9,13 +9,14 @@ This module defines all database tables for the Stock Management system:
 - SaleOrder: Sales to customers
 - SaleOrderItem: Items in each sale
 - StockMovement: Complete stock movement history
+- DailyProductSales: Daily sales rollup per product (derived, see database/rollups.py)
 """
 
 from datetime import datetime
 from decimal import Decimal
 from sqlalchemy import (
     Column, Integer, String, Numeric, Boolean, DateTime, 
-    Date, Text, ForeignKey, CheckConstraint
+    Date, Text, Float, ForeignKey, CheckConstraint, Index
 )
 from sqlalchemy.orm import relationship
 from database.connection import Base
@@ -112,6 +113,8 @@ class PurchaseOrder(Base):
             "status IN ('PENDING', 'RECEIVED', 'CANCELLED')",
             name='check_purchase_status'
         ),
+        # Period filters on received orders (turnover, suppliers)
+        Index('ix_purchase_order_status_date', 'status', 'order_date'),
     )
     
     def __repr__(self):
@@ -136,6 +139,11 @@ class PurchaseOrderItem(Base):
     purchase_order = relationship("PurchaseOrder", back_populates="items")
     product = relationship("Product", back_populates="purchase_items")
     
+    __table_args__ = (
+        # Covers per-product purchase lookups without reading the table
+        Index('ix_purchase_item_product_order', 'product_id', 'purchase_order_id', 'quantity', 'unit_price'),
+    )
+    
     def __repr__(self):
         return f"<PurchaseOrderItem(id={self.id}, product_id={self.product_id}, qty={self.quantity})>"
 
@@ -169,6 +177,8 @@ class SaleOrder(Base):
             "status IN ('PENDING', 'PAID', 'CANCELLED')",
             name='check_sale_status'
         ),
+        # Period filters on paid sales (sales, rollups, alerts)
+        Index('ix_sale_order_status_date', 'status', 'sale_date'),
     )
     
     def __repr__(self):
@@ -193,6 +203,11 @@ class SaleOrderItem(Base):
     sale_order = relationship("SaleOrder", back_populates="items")
     product = relationship("Product", back_populates="sale_items")
     
+    __table_args__ = (
+        # Covers per-product sales aggregates without reading the table
+        Index('ix_sale_item_product_order', 'product_id', 'sale_order_id', 'quantity', 'unit_price'),
+    )
+    
     def __repr__(self):
         return f"<SaleOrderItem(id={self.id}, product_id={self.product_id}, qty={self.quantity})>"
 
@@ -229,7 +244,35 @@ class StockMovement(Base):
             "movement_type IN ('PURCHASE', 'SALE', 'ADJUSTMENT', 'RETURN', 'LOSS')",
             name='check_movement_type'
         ),
+        # Per-product history within a period (covers stock_after as well)
+        Index('ix_stock_movement_product_date', 'product_id', 'movement_date', 'stock_after'),
+        # Latest stock-out of a product (stock_after = 0)
+        Index('ix_stock_movement_product_stock_after', 'product_id', 'stock_after', 'movement_date'),
+        # Latest movement of a given type per product (e.g. last purchase)
+        Index('ix_stock_movement_product_type_date', 'product_id', 'movement_type', 'movement_date'),
     )
     
     def __repr__(self):
         return f"<StockMovement(id={self.id}, type='{self.movement_type}', qty={self.quantity})>"
+
+
+class DailyProductSales(Base):
+    """
+    Daily paid-sales rollup per product.
+    
+    Derived table rebuilt by database.rollups.refresh_daily_product_sales();
+    it plays the role of a materialized view (SQLite has none).
+    """
+    
+    __tablename__ = 'daily_product_sales'
+    
+    product_id = Column(Integer, ForeignKey('product.id'), primary_key=True)
+    sale_date = Column(Date, primary_key=True, index=True)
+    
+    revenue = Column(Float, nullable=False)  # SUM(quantity * unit_price)
+    quantity = Column(Float, nullable=False)  # SUM(quantity)
+    order_count = Column(Integer, nullable=False)  # COUNT(DISTINCT sale_order_id)
+    item_count = Column(Integer, nullable=False)  # COUNT(sale_order_item.id)
+    
+    def __repr__(self):
+        return f"<DailyProductSales(product_id={self.product_id}, date={self.sale_date}, qty={self.quantity})>"
@@ -20,6 +20,7 @@ from faker import Faker
 from sqlalchemy.orm import Session
 
 from database.connection import SessionLocal, init_db, drop_all_tables
+from database.rollups import refresh_rollups
 from database.schema import (
     Product, Supplier, PurchaseOrder, PurchaseOrderItem,
     SaleOrder, SaleOrderItem, StockMovement
@@ -70,6 +71,10 @@ class DataGenerator:
         print("📊 Step 6: Creating special scenarios...")
         self.create_special_scenarios()
         
+        print("📈 Step 7: Refreshing rollups...")
+        self.session.commit()
+        refresh_rollups()
+        
         print("\n✅ Data generation completed!")
         self.print_summary()
     
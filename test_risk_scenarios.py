@@ -5,10 +5,49 @@ This script calls detect_imminent_stockout_risk() and displays the results
 to verify that the fake data was generated correctly.
 """
 
+from typing import Any, Dict, List, NamedTuple
+
 from tools.stockout_risk import detect_imminent_stockout_risk, get_pending_order_summary
 from tools.stock_analysis import detect_stock_rupture
 
 
+class RiskClassification(NamedTuple):
+    """Groupings of at-risk products shared by the risk tests."""
+    by_risk: Dict[str, List[Dict[str, Any]]]
+    no_po: List[Dict[str, Any]]
+    with_insufficient: List[Dict[str, Any]]
+    with_delayed: List[Dict[str, Any]]
+    with_sufficient: List[Dict[str, Any]]
+
+
+def classify(at_risk):
+    """Group at-risk products by risk level and by scenario A/B/C/D in one pass."""
+    groups = RiskClassification(
+        by_risk={'CRITICAL': [], 'HIGH': [], 'MEDIUM': [], 'LOW': []},
+        no_po=[],
+        with_insufficient=[],
+        with_delayed=[],
+        with_sufficient=[]
+    )
+    
+    for p in at_risk:
+        groups.by_risk[p['risk_level']].append(p)
+        
+        po = p['pending_orders']
+        if po['count'] == 0:
+            groups.no_po.append(p)
+            continue
+        
+        if po['is_sufficient']:
+            groups.with_sufficient.append(p)
+        else:
+            groups.with_insufficient.append(p)
+        if po['is_delayed']:
+            groups.with_delayed.append(p)
+    
+    return groups
+
+
 def print_separator(title="", char="="):
     """Print a nice separator."""
     if title:
@@ -19,18 +58,24 @@ def print_separator(title="", char="="):
         print(f"\n{char * 80}\n")
 
 
-def test_imminent_risks():
-    """Test imminent stockout risk detection."""
-    print_separator("🎯 TESTING IMMINENT STOCKOUT RISK SCENARIOS")
-    
-    # Detect products at risk in the next 7 days
-    print("🔍 Calling detect_imminent_stockout_risk(days_forecast=30, min_days_threshold=7)...\n")
-    
+def fetch_at_risk():
+    """Detect products at risk in the next 7 days and classify them."""
     at_risk = detect_imminent_stockout_risk(
         days_forecast=30,
         days_history=90,
         min_days_threshold=7
     )
+    return at_risk, classify(at_risk)
+
+
+def test_imminent_risks(at_risk=None, groups=None):
+    """Test imminent stockout risk detection."""
+    print_separator("🎯 TESTING IMMINENT STOCKOUT RISK SCENARIOS")
+    
+    print("🔍 Calling detect_imminent_stockout_risk(days_forecast=30, min_days_threshold=7)...\n")
+    
+    if at_risk is None:
+        at_risk, groups = fetch_at_risk()
     
     print(f"📊 Found {len(at_risk)} products at risk\n")
     
@@ -43,20 +88,9 @@ def test_imminent_risks():
         print("\n   Run: python reseed_with_risk_scenarios.py")
         return
     
-    # Group by risk level
-    by_risk = {
-        'CRITICAL': [],
-        'HIGH': [],
-        'MEDIUM': [],
-        'LOW': []
-    }
-    
-    for product in at_risk:
-        by_risk[product['risk_level']].append(product)
-    
     # Display by risk level
     for risk_level in ['CRITICAL', 'HIGH', 'MEDIUM', 'LOW']:
-        products = by_risk[risk_level]
+        products = groups.by_risk[risk_level]
         if not products:
             continue
         
@@ -90,27 +124,21 @@ def test_imminent_risks():
         print()
 
 
-def test_scenario_breakdown():
+def test_scenario_breakdown(at_risk=None, groups=None):
     """Show breakdown of expected scenarios."""
     print_separator("📋 EXPECTED SCENARIO BREAKDOWN", "=")
     
-    at_risk = detect_imminent_stockout_risk(days_forecast=30, min_days_threshold=7)
+    if at_risk is None:
+        at_risk, groups = fetch_at_risk()
     
     if not at_risk:
         print("❌ No products at risk found. Run reseed_with_risk_scenarios.py first.")
         return
     
-    # Categorize
-    no_po = [p for p in at_risk if p['pending_orders']['count'] == 0]
-    with_insufficient = [p for p in at_risk 
-                         if p['pending_orders']['count'] > 0 
-                         and not p['pending_orders']['is_sufficient']]
-    with_delayed = [p for p in at_risk 
-                    if p['pending_orders']['count'] > 0 
-                    and p['pending_orders']['is_delayed']]
-    with_sufficient = [p for p in at_risk 
-                       if p['pending_orders']['count'] > 0 
-                       and p['pending_orders']['is_sufficient']]
+    no_po = groups.no_po
+    with_insufficient = groups.with_insufficient
+    with_delayed = groups.with_delayed
+    with_sufficient = groups.with_sufficient
     
     print("Scenario A: Products WITHOUT purchase orders")
     print(f"  Expected: ~6 products")
@@ -201,11 +229,14 @@ def main():
     print("=" * 80)
     
     try:
+        # Detect and classify once; shared by tests 1 and 2
+        at_risk, groups = fetch_at_risk()
+        
         # Test 1: Imminent risks
-        test_imminent_risks()
+        test_imminent_risks(at_risk, groups)
         
         # Test 2: Scenario breakdown
-        test_scenario_breakdown()
+        test_scenario_breakdown(at_risk, groups)
         
         # Test 3: Pending orders
         test_pending_orders()
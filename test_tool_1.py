@@ -9,6 +9,19 @@ sys.path.insert(0, '/Users/efreire/poc-projects/poc-stock')
 
 from tools.stock_analysis import detect_stock_rupture
 
+# Parsed once at import; rendered with str.format_map per product
+_RUPTURE_TMPL = (
+    "\n{i}. {name} (SKU: {sku})\n"
+    "   Category: {category}\n"
+    "   Current Stock: {current_stock}\n"
+    "   Recent Sales: {recent_sales_count} orders\n"
+    "   Total Sold (14d): {total_quantity_sold} units\n"
+    "   Daily Demand: {estimated_daily_demand} units/day\n"
+    "   Days Out of Stock: {days_out_of_stock}\n"
+    "   💰 Estimated Lost Revenue: R$ {lost_revenue_estimate:,.2f}\n"
+    "   Last Sale: {last_sale_date}"
+)
+
 def main():
     print("\n" + "=" * 70)
     print("🧪 TESTING TOOL #1: detect_stock_rupture")
@@ -28,15 +41,7 @@ def main():
         print("-" * 70)
         
         for i, product in enumerate(results[:5], 1):
-            print(f"\n{i}. {product['name']} (SKU: {product['sku']})")
-            print(f"   Category: {product['category']}")
-            print(f"   Current Stock: {product['current_stock']}")
-            print(f"   Recent Sales: {product['recent_sales_count']} orders")
-            print(f"   Total Sold (14d): {product['total_quantity_sold']} units")
-            print(f"   Daily Demand: {product['estimated_daily_demand']} units/day")
-            print(f"   Days Out of Stock: {product['days_out_of_stock']}")
-            print(f"   💰 Estimated Lost Revenue: R$ {product['lost_revenue_estimate']:,.2f}")
-            print(f"   Last Sale: {product['last_sale_date']}")
+            print(_RUPTURE_TMPL.format_map({**product, 'i': i}))
         
         # Calculate totals
         total_lost_revenue = sum(p['lost_revenue_estimate'] for p in results)
@@ -9,6 +9,17 @@ sys.path.insert(0, '/Users/efreire/poc-projects/poc-stock')
 
 from tools.stock_analysis import analyze_slow_moving_stock
 
+# Parsed once at import; rendered with str.format_map per product
+_SLOW_TMPL = (
+    "\n{i}. {name} (SKU: {sku})\n"
+    "   Category: {category}\n"
+    "   Current Stock: {current_stock:.2f} units\n"
+    "   💰 Stock Value: R$ {stock_value:,.2f}\n"
+    "   Last Sale: {last_sale_display}\n"
+    "   Days Without Sale: {days_display}\n"
+    "   📋 {recommendation}"
+)
+
 def main():
     print("\n" + "=" * 70)
     print("🧪 TESTING TOOL #2: analyze_slow_moving_stock")
@@ -30,13 +41,12 @@ def main():
         for i, product in enumerate(results[:10], 1):
             days_display = f"{product['days_without_sale']} days" if product['days_without_sale'] else "Never sold"
             
-            print(f"\n{i}. {product['name']} (SKU: {product['sku']})")
-            print(f"   Category: {product['category']}")
-            print(f"   Current Stock: {product['current_stock']:.2f} units")
-            print(f"   💰 Stock Value: R$ {product['stock_value']:,.2f}")
-            print(f"   Last Sale: {product['last_sale_date'] or 'Never'}")
-            print(f"   Days Without Sale: {days_display}")
-            print(f"   📋 {product['recommendation']}")
+            print(_SLOW_TMPL.format_map({
+                **product,
+                'i': i,
+                'last_sale_display': product['last_sale_date'] or 'Never',
+                'days_display': days_display
+            }))
         
         # Calculate totals
         total_stock_value = sum(p['stock_value'] for p in results)
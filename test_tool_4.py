@@ -9,6 +9,16 @@ sys.path.insert(0, '/Users/efreire/poc-projects/poc-stock')
 
 from tools.loss_detection import detect_stock_losses, get_explicit_losses
 
+# Parsed once at import; rendered with str.format_map per loss record
+_LOSS_TMPL = (
+    "\n{i}. {product_name} (SKU: {sku})\n"
+    "   Category: {category}\n"
+    "   Quantity Lost: {quantity_lost:.2f} units\n"
+    "   💰 Loss Value: R$ {loss_value:,.2f}\n"
+    "   Date: {loss_date} ({days_ago} days ago)\n"
+    "   Notes: {notes}"
+)
+
 def main():
     print("\n" + "=" * 70)
     print("🧪 TESTING TOOL #4: detect_stock_losses & get_explicit_losses")
@@ -81,12 +91,7 @@ def main():
         print("-" * 70)
         
         for i, loss in enumerate(losses[:10], 1):  # Show top 10
-            print(f"\n{i}. {loss['product_name']} (SKU: {loss['sku']})")
-            print(f"   Category: {loss['category']}")
-            print(f"   Quantity Lost: {loss['quantity_lost']:.2f} units")
-            print(f"   💰 Loss Value: R$ {loss['loss_value']:,.2f}")
-            print(f"   Date: {loss['loss_date']} ({loss['days_ago']} days ago)")
-            print(f"   Notes: {loss['notes']}")
+            print(_LOSS_TMPL.format_map({**loss, 'i': i}))
         
         # Summary
         total_quantity_lost = sum(l['quantity_lost'] for l in losses)
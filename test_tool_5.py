@@ -72,7 +72,7 @@ def main():
     print("\n📊 Test 2: Grouping suggestions by supplier")
     print("-" * 70)
     
-    grouped = group_suggestions_by_supplier()
+    grouped = group_suggestions_by_supplier(suggestions)
     
     print(f"\n✅ Grouped into {len(grouped)} supplier orders\n")
     
@@ -4,139 +4,161 @@ Test script for Tool #6: get_top_selling_products
 This script tests the sales analysis tools.
 """
 
+import functools
+import io
 import sys
 sys.path.insert(0, '/Users/efreire/poc-projects/poc-stock')
 
+import numpy as np
+
 from tools.sales_analysis import get_top_selling_products, get_sales_by_category
 
+_STATUS_ICONS = {"OK": "✅", "LOW": "⚠️", "OUT": "🔴"}
+
 def main():
-    print("\n" + "=" * 70)
-    print("🧪 TESTING TOOL #6: get_top_selling_products")
-    print("=" * 70)
-    
-    # Test 1: Top by revenue
-    print("\n📊 Test 1: Top 10 products by REVENUE (last 30 days)")
-    print("-" * 70)
-    
-    top_revenue = get_top_selling_products(period='month', limit=10, metric='revenue')
-    
-    print(f"\n✅ Found {len(top_revenue)} top-selling products\n")
-    
-    if top_revenue:
-        print("💰 TOP 10 BY REVENUE:")
-        print("-" * 70)
+    # Collect the report and write it to stdout in one go, even if a
+    # tool call fails
+    buf = io.StringIO()
+    out = functools.partial(print, file=buf)
+    
+    try:
+        out("\n" + "=" * 70)
+        out("🧪 TESTING TOOL #6: get_top_selling_products")
+        out("=" * 70)
+        
+        # Test 1: Top by revenue
+        out("\n📊 Test 1: Top 10 products by REVENUE (last 30 days)")
+        out("-" * 70)
         
-        for product in top_revenue:
-            status_icon = {"OK": "✅", "LOW": "⚠️", "OUT": "🔴"}
-            icon = status_icon.get(product['stock_status'], "⚪")
+        top_revenue = get_top_selling_products(period='month', limit=10, metric='revenue')
+        
+        out(f"\n✅ Found {len(top_revenue)} top-selling products\n")
+        
+        if top_revenue:
+            out("💰 TOP 10 BY REVENUE:")
+            out("-" * 70)
             
-            print(f"\n#{product['rank']}. {product['name']} (SKU: {product['sku']})")
-            print(f"   Category: {product['category']}")
-            print(f"   💰 Revenue: R$ {product['total_revenue']:,.2f} ({product['percentage_of_total']:.1f}%)")
-            print(f"   📦 Units Sold: {product['total_quantity']:.0f}")
-            print(f"   🛒 Sales Count: {product['sales_count']}")
-            print(f"   📊 Avg Sale Value: R$ {product['avg_sale_value']:,.2f}")
-            print(f"   📈 Avg Qty/Sale: {product['avg_quantity_per_sale']:.1f}")
-            print(f"   {icon} Stock: {product['current_stock']:.0f} units ({product['stock_status']})")
-        
-        # Calculate totals
-        total_revenue = sum(p['total_revenue'] for p in top_revenue)
-        total_quantity = sum(p['total_quantity'] for p in top_revenue)
-        
-        print("\n" + "=" * 70)
-        print("📈 TOP 10 SUMMARY")
-        print("=" * 70)
-        print(f"💰 Total Revenue: R$ {total_revenue:,.2f}")
-        print(f"📦 Total Units Sold: {total_quantity:.0f}")
-        
-        # Stock alerts
-        low_stock = [p for p in top_revenue if p['stock_status'] == 'LOW']
-        out_stock = [p for p in top_revenue if p['stock_status'] == 'OUT']
-        
-        if out_stock or low_stock:
-            print(f"\n⚠️  STOCK ALERTS:")
-            print(f"   🔴 Out of Stock: {len(out_stock)} products")
-            print(f"   ⚠️  Low Stock: {len(low_stock)} products")
-    
-    # Test 2: Top by quantity
-    print("\n" + "=" * 70)
-    print("\n📊 Test 2: Top 5 products by QUANTITY SOLD")
-    print("-" * 70)
-    
-    top_quantity = get_top_selling_products(period='month', limit=5, metric='quantity')
-    
-    print(f"\n📦 TOP 5 BY QUANTITY:\n")
-    for product in top_quantity:
-        print(f"#{product['rank']}. {product['name']}")
-        print(f"   Units Sold: {product['total_quantity']:.0f} ({product['percentage_of_total']:.1f}%)\n")
-    
-    # Test 3: Top by frequency
-    print("=" * 70)
-    print("\n📊 Test 3: Top 5 products by SALES FREQUENCY")
-    print("-" * 70)
-    
-    top_frequency = get_top_selling_products(period='month', limit=5, metric='frequency')
-    
-    print(f"\n🛒 TOP 5 BY FREQUENCY:\n")
-    for product in top_frequency:
-        print(f"#{product['rank']}. {product['name']}")
-        print(f"   Sales Count: {product['sales_count']} orders ({product['percentage_of_total']:.1f}%)\n")
-    
-    # Test 4: By category
-    print("=" * 70)
-    print("\n📊 Test 4: Sales by CATEGORY (last 30 days)")
-    print("-" * 70)
-    
-    by_category = get_sales_by_category(period='month')
-    
-    print(f"\n✅ Analyzed {len(by_category)} categories\n")
-    
-    if by_category:
-        print("📊 CATEGORY PERFORMANCE:")
-        print("-" * 70)
-        
-        for i, cat in enumerate(by_category, 1):
-            print(f"\n{i}. {cat['category']}")
-            print(f"   Products: {cat['products_count']}")
-            print(f"   💰 Revenue: R$ {cat['total_revenue']:,.2f} ({cat['percentage_of_total']:.1f}%)")
-            print(f"   📦 Units Sold: {cat['total_quantity']:.0f}")
-            print(f"   🛒 Sales: {cat['sales_count']}")
-            print(f"   📊 Avg per Product: R$ {cat['avg_product_revenue']:,.2f}")
-        
-        # Summary
-        total_cat_revenue = sum(c['total_revenue'] for c in by_category)
-        
-        print("\n" + "=" * 70)
-        print("📈 CATEGORY SUMMARY")
-        print("=" * 70)
-        print(f"Total Categories: {len(by_category)}")
-        print(f"💰 Total Revenue: R$ {total_cat_revenue:,.2f}")
-    
-    # Test 5: Different periods
-    print("\n" + "=" * 70)
-    print("\n📊 Test 5: Comparing different periods (Top 3)")
-    print("-" * 70)
-    
-    top_week = get_top_selling_products(period='week', limit=3, metric='revenue')
-    top_quarter = get_top_selling_products(period='quarter', limit=3, metric='revenue')
-    
-    print(f"\n🗓️  LAST WEEK:")
-    for i, p in enumerate(top_week, 1):
-        print(f"   {i}. {p['name'][:40]} - R$ {p['total_revenue']:,.2f}")
-    
-    print(f"\n🗓️  LAST MONTH (30 days):")
-    for i, p in enumerate(top_revenue[:3], 1):
-        print(f"   {i}. {p['name'][:40]} - R$ {p['total_revenue']:,.2f}")
-    
-    print(f"\n🗓️  LAST QUARTER (90 days):")
-    for i, p in enumerate(top_quarter, 1):
-        print(f"   {i}. {p['name'][:40]} - R$ {p['total_revenue']:,.2f}")
-    
-    print("\n" + "=" * 70)
-    print("✅ TOOL #6 TEST COMPLETED!")
-    print("=" * 70)
-    
-    return len(top_revenue) > 0
+            for product in top_revenue:
+                icon = _STATUS_ICONS.get(product['stock_status'], "⚪")
+                
+                out(f"\n#{product['rank']}. {product['name']} (SKU: {product['sku']})")
+                out(f"   Category: {product['category']}")
+                out(f"   💰 Revenue: R$ {product['total_revenue']:,.2f} ({product['percentage_of_total']:.1f}%)")
+                out(f"   📦 Units Sold: {product['total_quantity']:.0f}")
+                out(f"   🛒 Sales Count: {product['sales_count']}")
+                out(f"   📊 Avg Sale Value: R$ {product['avg_sale_value']:,.2f}")
+                out(f"   📈 Avg Qty/Sale: {product['avg_quantity_per_sale']:.1f}")
+                out(f"   {icon} Stock: {product['current_stock']:.0f} units ({product['stock_status']})")
+            
+            # Extract columns once and reduce them with NumPy
+            n = len(top_revenue)
+            revenue = np.fromiter((p['total_revenue'] for p in top_revenue), dtype=np.float64, count=n)
+            quantity = np.fromiter((p['total_quantity'] for p in top_revenue), dtype=np.float64, count=n)
+            status = np.array([p['stock_status'] for p in top_revenue])
+            
+            # Calculate totals
+            total_revenue = revenue.sum()
+            total_quantity = quantity.sum()
+            
+            out("\n" + "=" * 70)
+            out("📈 TOP 10 SUMMARY")
+            out("=" * 70)
+            out(f"💰 Total Revenue: R$ {total_revenue:,.2f}")
+            out(f"📦 Total Units Sold: {total_quantity:.0f}")
+            
+            # Stock alerts
+            low_stock = int((status == 'LOW').sum())
+            out_stock = int((status == 'OUT').sum())
+            
+            if out_stock or low_stock:
+                out(f"\n⚠️  STOCK ALERTS:")
+                out(f"   🔴 Out of Stock: {out_stock} products")
+                out(f"   ⚠️  Low Stock: {low_stock} products")
+        
+        # Test 2: Top by quantity
+        out("\n" + "=" * 70)
+        out("\n📊 Test 2: Top 5 products by QUANTITY SOLD")
+        out("-" * 70)
+        
+        top_quantity = get_top_selling_products(period='month', limit=5, metric='quantity')
+        
+        out(f"\n📦 TOP 5 BY QUANTITY:\n")
+        for product in top_quantity:
+            out(f"#{product['rank']}. {product['name']}")
+            out(f"   Units Sold: {product['total_quantity']:.0f} ({product['percentage_of_total']:.1f}%)\n")
+        
+        # Test 3: Top by frequency
+        out("=" * 70)
+        out("\n📊 Test 3: Top 5 products by SALES FREQUENCY")
+        out("-" * 70)
+        
+        top_frequency = get_top_selling_products(period='month', limit=5, metric='frequency')
+        
+        out(f"\n🛒 TOP 5 BY FREQUENCY:\n")
+        for product in top_frequency:
+            out(f"#{product['rank']}. {product['name']}")
+            out(f"   Sales Count: {product['sales_count']} orders ({product['percentage_of_total']:.1f}%)\n")
+        
+        # Test 4: By category
+        out("=" * 70)
+        out("\n📊 Test 4: Sales by CATEGORY (last 30 days)")
+        out("-" * 70)
+        
+        by_category = get_sales_by_category(period='month')
+        
+        out(f"\n✅ Analyzed {len(by_category)} categories\n")
+        
+        if by_category:
+            out("📊 CATEGORY PERFORMANCE:")
+            out("-" * 70)
+            
+            for i, cat in enumerate(by_category, 1):
+                out(f"\n{i}. {cat['category']}")
+                out(f"   Products: {cat['products_count']}")
+                out(f"   💰 Revenue: R$ {cat['total_revenue']:,.2f} ({cat['percentage_of_total']:.1f}%)")
+                out(f"   📦 Units Sold: {cat['total_quantity']:.0f}")
+                out(f"   🛒 Sales: {cat['sales_count']}")
+                out(f"   📊 Avg per Product: R$ {cat['avg_product_revenue']:,.2f}")
+            
+            # Summary
+            total_cat_revenue = np.fromiter(
+                (c['total_revenue'] for c in by_category), dtype=np.float64, count=len(by_category)
+            ).sum()
+            
+            out("\n" + "=" * 70)
+            out("📈 CATEGORY SUMMARY")
+            out("=" * 70)
+            out(f"Total Categories: {len(by_category)}")
+            out(f"💰 Total Revenue: R$ {total_cat_revenue:,.2f}")
+        
+        # Test 5: Different periods
+        out("\n" + "=" * 70)
+        out("\n📊 Test 5: Comparing different periods (Top 3)")
+        out("-" * 70)
+        
+        top_week = get_top_selling_products(period='week', limit=3, metric='revenue')
+        top_quarter = get_top_selling_products(period='quarter', limit=3, metric='revenue')
+        
+        out(f"\n🗓️  LAST WEEK:")
+        for i, p in enumerate(top_week, 1):
+            out(f"   {i}. {p['name'][:40]} - R$ {p['total_revenue']:,.2f}")
+        
+        out(f"\n🗓️  LAST MONTH (30 days):")
+        for i, p in enumerate(top_revenue[:3], 1):
+            out(f"   {i}. {p['name'][:40]} - R$ {p['total_revenue']:,.2f}")
+        
+        out(f"\n🗓️  LAST QUARTER (90 days):")
+        for i, p in enumerate(top_quarter, 1):
+            out(f"   {i}. {p['name'][:40]} - R$ {p['total_revenue']:,.2f}")
+        
+        out("\n" + "=" * 70)
+        out("✅ TOOL #6 TEST COMPLETED!")
+        out("=" * 70)
+        
+        return len(top_revenue) > 0
+        
+    finally:
+        sys.stdout.write(buf.getvalue())
 
 if __name__ == "__main__":
     success = main()
@@ -5,62 +5,69 @@ This module contains all the analysis tools that the LangChain agent
 can use to query and analyze stock data.
 """
 
-# Stock Analysis
-from tools.stock_analysis import (
-    detect_stock_rupture,
-    analyze_slow_moving_stock
-)
+import importlib
 
-# Stockout Risk (NEW - 2026-02-08)
-from tools.stockout_risk import (
-    detect_imminent_stockout_risk,
-    get_pending_order_summary
-)
-
-# Purchase Suggestions (ENHANCED - 2026-02-08)
-from tools.purchase_suggestions import (
-    suggest_purchase_order,
-    group_suggestions_by_supplier
-)
-
-# Alerts (ENHANCED - 2026-02-08)
-from tools.alerts import get_stock_alerts
-
-# Sales Analysis
-from tools.sales_analysis import (
-    get_top_selling_products,
-    get_sales_by_category
-)
-
-# Loss Detection
-from tools.loss_detection import (
-    detect_stock_losses,
-    get_explicit_losses
-)
-
-# ABC Analysis
-from tools.abc_analysis import get_abc_analysis
-
-# Supplier Analysis
-from tools.supplier_analysis import analyze_supplier_performance
+# Submodules are imported lazily (PEP 562) on first attribute access, so
+# scripts that only need one tool do not pay for loading all of them.
+_LAZY = {
+    # Stock Analysis
+    'detect_stock_rupture': 'tools.stock_analysis',
+    'analyze_slow_moving_stock': 'tools.stock_analysis',
+    
+    # Stockout Risk (NEW - 2026-02-08)
+    'detect_imminent_stockout_risk': 'tools.stockout_risk',
+    'get_pending_order_summary': 'tools.stockout_risk',
+    
+    # Purchase Suggestions (ENHANCED - 2026-02-08)
+    'suggest_purchase_order': 'tools.purchase_suggestions',
+    'group_suggestions_by_supplier': 'tools.purchase_suggestions',
+    
+    # Alerts (ENHANCED - 2026-02-08)
+    'get_stock_alerts': 'tools.alerts',
+    
+    # Sales Analysis
+    'get_top_selling_products': 'tools.sales_analysis',
+    'get_sales_by_category': 'tools.sales_analysis',
+    
+    # Loss Detection
+    'detect_stock_losses': 'tools.loss_detection',
+    'get_explicit_losses': 'tools.loss_detection',
+    
+    # ABC Analysis
+    'get_abc_analysis': 'tools.abc_analysis',
+    
+    # Supplier Analysis
+    'analyze_supplier_performance': 'tools.supplier_analysis',
+    
+    # Turnover Analysis
+    'analyze_purchase_to_sale_time': 'tools.turnover_analysis',
+    'get_inventory_age_distribution': 'tools.turnover_analysis',
+    
+    # Profitability Analysis
+    'calculate_profitability_analysis': 'tools.profitability_analysis',
+    'get_profitability_summary': 'tools.profitability_analysis',
+    
+    # Availability Analysis
+    'detect_availability_issues': 'tools.availability_analysis',
+    
+    # Operational Availability (NEW - 2026-02-08)
+    'detect_operational_availability_issues': 'tools.operational_availability',
+}
 
-# Turnover Analysis
-from tools.turnover_analysis import (
-    analyze_purchase_to_sale_time,
-    get_inventory_age_distribution
-)
 
-# Profitability Analysis
-from tools.profitability_analysis import (
-    calculate_profitability_analysis,
-    get_profitability_summary
-)
+def __getattr__(name):
+    """Import the submodule that defines `name` on first access."""
+    if name not in _LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    
+    module = importlib.import_module(_LAZY[name])
+    value = getattr(module, name)
+    globals()[name] = value
+    return value
 
-# Availability Analysis
-from tools.availability_analysis import detect_availability_issues
 
-# Operational Availability (NEW - 2026-02-08)
-from tools.operational_availability import detect_operational_availability_issues
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
 
 __all__ = [
     # Stock Analysis
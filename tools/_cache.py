@@ -0,0 +1,161 @@
+"""
+Result caching helpers for analysis tools.
+
+The analysis tools are read-only views over the database, and a single
+dashboard refresh or agent conversation often asks for the same analysis
+several times. This module provides a small in-process cache so repeated
+calls with the same arguments reuse one query result.
+
+Entries are grouped in time buckets of TOOL_CACHE_TTL_SECONDS (default: 300)
+so long-running processes (Streamlit) still pick up new data. Set the
+variable to 0 to disable caching.
+
+Tools returning JSON-safe results can also be shared between processes
+through Redis: set REDIS_URL and install the `redis` package (plus `orjson`
+for faster serialization). Without them only the in-process cache is used.
+"""
+
+import copy
+import hashlib
+import inspect
+import json
+import os
+import time
+from functools import lru_cache, wraps
+from typing import Any, Callable, List
+
+from database.rollups import on_rollups_refreshed
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - optional dependency
+    redis = None
+
+DEFAULT_TTL_SECONDS = int(os.getenv('TOOL_CACHE_TTL_SECONDS', '300'))
+REDIS_URL = os.getenv('REDIS_URL')
+
+# Underlying lru_cache objects, so all caches can be cleared at once
+_caches: List[Callable] = []
+
+_redis_client = None
+
+
+def _get_redis():
+    """Return a shared Redis client, or None when Redis is not configured."""
+    global _redis_client
+    
+    if _redis_client is None and REDIS_URL and redis is not None:
+        _redis_client = redis.Redis.from_url(REDIS_URL)
+    return _redis_client
+
+
+def _dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(value, sort_keys=True, separators=(',', ':')).encode()
+
+
+def _loads(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _redis_key(func: Callable, arguments: dict) -> str:
+    digest = hashlib.blake2b(_dumps(arguments), digest_size=16).hexdigest()
+    return f"tool-cache:{func.__module__}.{func.__name__}:{digest}"
+
+
+def ttl_lru_cache(ttl_seconds: int = DEFAULT_TTL_SECONDS, maxsize: int = 64, shared: bool = False):
+    """
+    Memoize a tool function for a limited amount of time.
+    
+    Calls are keyed by their bound arguments (defaults applied), so
+    `f('month')` and `f(period='month')` share the same entry. Each hit
+    returns a deep copy, so callers may freely modify the result.
+    Pass `force=True` to a decorated function to bypass the cache.
+    
+    Args:
+        ttl_seconds: Lifetime of a cache bucket in seconds (0 disables caching)
+        maxsize: Maximum number of cached argument combinations
+        shared: Also store results in Redis (when REDIS_URL is set).
+            Results that are not JSON-safe stay in-process only.
+    
+    Example:
+        >>> @ttl_lru_cache(ttl_seconds=60, shared=True)
+        >>> def get_top_selling_products(period='month', limit=10): ...
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+        
+        def load(arguments):
+            client = _get_redis() if shared else None
+            if client is None:
+                return func(**arguments)
+            
+            key = _redis_key(func, arguments)
+            try:
+                data = client.get(key)
+                if data is not None:
+                    return _loads(data)
+            except redis.RedisError:
+                return func(**arguments)
+            
+            result = func(**arguments)
+            try:
+                client.setex(key, ttl_seconds, _dumps(result))
+            except (TypeError, redis.RedisError):
+                # Not JSON-safe (e.g. a DataFrame) or Redis unavailable
+                pass
+            return result
+        
+        @lru_cache(maxsize=maxsize)
+        def cached(time_bucket, arguments):
+            return load(dict(arguments))
+        
+        @wraps(func)
+        def wrapper(*args, force: bool = False, **kwargs):
+            if ttl_seconds <= 0 or force:
+                return func(*args, **kwargs)
+            
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            time_bucket = int(time.time() // ttl_seconds)
+            
+            result = cached(time_bucket, tuple(bound.arguments.items()))
+            return copy.deepcopy(result)
+        
+        wrapper.cache_clear = cached.cache_clear
+        wrapper.cache_info = cached.cache_info
+        _caches.append(cached)
+        return wrapper
+    
+    return decorator
+
+
+@on_rollups_refreshed
+def clear_all_caches():
+    """
+    Drop every cached tool result.
+    
+    Call this after writing to the database (e.g. re-seeding) when
+    results must reflect the new data immediately. Shared entries in
+    Redis are removed as well. It runs automatically after
+    database.rollups.refresh_rollups().
+    """
+    for cached in _caches:
+        cached.cache_clear()
+    
+    client = _get_redis()
+    if client is not None:
+        try:
+            keys = list(client.scan_iter('tool-cache:*'))
+            if keys:
+                client.delete(*keys)
+        except redis.RedisError:
+            pass
@@ -7,11 +7,12 @@ to categorize products by their contribution to revenue or profit.
 
 from datetime import datetime, timedelta
 from typing import List, Dict, Any
-from sqlalchemy import func, and_
+from sqlalchemy import func, case, select
 from sqlalchemy.orm import Session
 
 from database.connection import SessionLocal
-from database.schema import Product, SaleOrder, SaleOrderItem
+from database.rollups import ensure_rollups_fresh
+from database.schema import Product, DailyProductSales
 
 
 def get_abc_analysis(
@@ -50,140 +51,123 @@ def get_abc_analysis(
         >>> class_a = [p for p in abc['classification'] if p['abc_class'] == 'A']
         >>> print(f"Class A: {len(class_a)} products generating {abc['summary']['class_a']['percentage']:.1f}%")
     """
+    ensure_rollups_fresh()
     session = SessionLocal()
     
     try:
+        now = datetime.now()
+        
         # Determine date range
         if period == 'week':
-            cutoff_date = datetime.now() - timedelta(days=7)
+            cutoff_date = now - timedelta(days=7)
         elif period == 'month':
-            cutoff_date = datetime.now() - timedelta(days=30)
+            cutoff_date = now - timedelta(days=30)
         elif period == 'quarter':
-            cutoff_date = datetime.now() - timedelta(days=90)
+            cutoff_date = now - timedelta(days=90)
         else:  # 'all'
             cutoff_date = datetime.min
         
-        # Query products with sales
-        products_data = session.query(
-            Product.id,
+        # Aggregate the selected metric per product from the daily sales rollup
+        total_revenue = func.sum(DailyProductSales.revenue)
+        total_quantity = func.sum(DailyProductSales.quantity)
+        
+        if metric == 'revenue':
+            metric_value = total_revenue
+        elif metric == 'profit':
+            metric_value = total_revenue - total_quantity * Product.cost_price
+        else:  # 'quantity'
+            metric_value = total_quantity
+        
+        per_product = select(
+            Product.id.label('product_id'),
             Product.sku,
             Product.name,
             Product.category,
-            Product.cost_price,
-            func.sum(SaleOrderItem.quantity * SaleOrderItem.unit_price).label('total_revenue'),
-            func.sum(SaleOrderItem.quantity).label('total_quantity')
+            total_revenue.label('total_revenue'),
+            total_quantity.label('total_quantity'),
+            metric_value.label('metric_value')
         ).join(
-            SaleOrderItem, Product.id == SaleOrderItem.product_id
-        ).join(
-            SaleOrder, SaleOrderItem.sale_order_id == SaleOrder.id
-        ).filter(
-            and_(
-                SaleOrder.sale_date >= cutoff_date.date(),
-                SaleOrder.status == 'PAID'
-            )
+            DailyProductSales, Product.id == DailyProductSales.product_id
+        ).where(
+            DailyProductSales.sale_date >= cutoff_date.date()
         ).group_by(
             Product.id,
             Product.sku,
             Product.name,
             Product.category,
             Product.cost_price
-        ).all()
+        ).subquery()
         
-        if not products_data:
-            return {
-                'classification': [],
-                'summary': {},
-                'recommendations': []
-            }
+        # Running total (ties keep product order) and ABC class in the database
+        ranking = (per_product.c.metric_value.desc(), per_product.c.product_id)
+        ranked = select(
+            per_product,
+            func.sum(per_product.c.metric_value).over().label('total_metric'),
+            func.sum(per_product.c.metric_value).over(order_by=ranking, rows=(None, 0)).label('cumulative_value')
+        ).subquery()
         
-        # Calculate metric for each product
-        products_list = []
-        for row in products_data:
-            total_revenue = float(row.total_revenue)
-            total_quantity = float(row.total_quantity)
-            cost_price = float(row.cost_price)
-            
-            # Calculate metric value
-            if metric == 'revenue':
-                metric_value = total_revenue
-            elif metric == 'profit':
-                total_cost = total_quantity * cost_price
-                metric_value = total_revenue - total_cost
-            else:  # 'quantity'
-                metric_value = total_quantity
-            
-            products_list.append({
-                'product_id': row.id,
-                'sku': row.sku,
-                'name': row.name,
-                'category': row.category or 'N/A',
-                'metric_value': metric_value,
-                'total_revenue': total_revenue,
-                'total_quantity': total_quantity
-            })
+        cumulative_percentage = ranked.c.cumulative_value * 100.0 / ranked.c.total_metric
+        stmt = select(
+            ranked,
+            case(
+                (ranked.c.total_metric <= 0, 'A'),
+                (cumulative_percentage <= 80, 'A'),
+                (cumulative_percentage <= 95, 'B'),
+                else_='C'
+            ).label('abc_class')
+        ).order_by(ranked.c.metric_value.desc(), ranked.c.product_id)
         
-        # Sort by metric value (descending)
-        products_list.sort(key=lambda x: x['metric_value'], reverse=True)
-        
-        # Calculate total and percentages
-        total_metric = sum(p['metric_value'] for p in products_list)
+        # Stream rows in batches instead of materializing the whole result
+        rows = session.execute(stmt.execution_options(yield_per=1000)).mappings()
         
+        total_metric = 0.0
         classification = []
-        cumulative = 0
+        class_totals = {abc_class: [0, 0.0, 0.0] for abc_class in 'ABC'}  # count, value, percentage
         
-        for product in products_list:
-            percentage = (product['metric_value'] / total_metric * 100) if total_metric > 0 else 0
-            cumulative += percentage
-            
-            # Assign ABC class based on cumulative percentage
-            if cumulative <= 80:
-                abc_class = 'A'
-            elif cumulative <= 95:
-                abc_class = 'B'
-            else:
-                abc_class = 'C'
+        for row in rows:
+            total_metric = float(row['total_metric'])
+            product_metric = float(row['metric_value'])
+            percentage = (product_metric / total_metric * 100) if total_metric > 0 else 0
+            cumulative = (float(row['cumulative_value']) / total_metric * 100) if total_metric > 0 else 0
             
             classification.append({
-                'product_id': product['product_id'],
-                'sku': product['sku'],
-                'name': product['name'],
-                'category': product['category'],
-                'metric_value': round(product['metric_value'], 2),
-                'total_revenue': round(product['total_revenue'], 2),
-                'total_quantity': round(product['total_quantity'], 2),
+                'product_id': row['product_id'],
+                'sku': row['sku'],
+                'name': row['name'],
+                'category': row['category'] or 'N/A',
+                'metric_value': round(product_metric, 2),
+                'total_revenue': round(float(row['total_revenue']), 2),
+                'total_quantity': round(float(row['total_quantity']), 2),
                 'percentage_of_total': round(percentage, 2),
                 'cumulative_percentage': round(cumulative, 2),
-                'abc_class': abc_class
+                'abc_class': row['abc_class']
             })
+            
+            totals = class_totals[row['abc_class']]
+            totals[0] += 1
+            totals[1] += classification[-1]['metric_value']
+            totals[2] += classification[-1]['percentage_of_total']
         
-        # Calculate summary statistics
-        class_a = [p for p in classification if p['abc_class'] == 'A']
-        class_b = [p for p in classification if p['abc_class'] == 'B']
-        class_c = [p for p in classification if p['abc_class'] == 'C']
+        if not classification:
+            return {
+                'classification': [],
+                'summary': {},
+                'recommendations': []
+            }
         
+        # Summary statistics (class totals accumulated above)
         summary = {
             'total_products': len(classification),
             'total_metric_value': round(total_metric, 2),
-            'metric_name': metric,
-            'class_a': {
-                'count': len(class_a),
-                'percentage_of_products': round(len(class_a) / len(classification) * 100, 1) if classification else 0,
-                'total_value': round(sum(p['metric_value'] for p in class_a), 2),
-                'percentage_of_total': round(sum(p['percentage_of_total'] for p in class_a), 1)
-            },
-            'class_b': {
-                'count': len(class_b),
-                'percentage_of_products': round(len(class_b) / len(classification) * 100, 1) if classification else 0,
-                'total_value': round(sum(p['metric_value'] for p in class_b), 2),
-                'percentage_of_total': round(sum(p['percentage_of_total'] for p in class_b), 1)
-            },
-            'class_c': {
-                'count': len(class_c),
-                'percentage_of_products': round(len(class_c) / len(classification) * 100, 1) if classification else 0,
-                'total_value': round(sum(p['metric_value'] for p in class_c), 2),
-                'percentage_of_total': round(sum(p['percentage_of_total'] for p in class_c), 1)
-            }
+            'metric_name': metric
         }
+        for abc_class, (count, total_value, percentage_of_total) in class_totals.items():
+            summary[f'class_{abc_class.lower()}'] = {
+                'count': count,
+                'percentage_of_products': round(count / len(classification) * 100, 1),
+                'total_value': round(total_value, 2),
+                'percentage_of_total': round(percentage_of_total, 1)
+            }
         
         # Recommendations by class
         recommendations = [
@@ -5,18 +5,39 @@ This module consolidates alerts from all other tools to provide
 a comprehensive overview of stock health and critical issues.
 """
 
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import List, Dict, Any
-from sqlalchemy import func, and_
+from sqlalchemy import func, and_, case, select
 
-from database.connection import SessionLocal
-from database.schema import Product, SaleOrder, SaleOrderItem, StockMovement
+from database.connection import SessionLocal, DATABASE_URL
+from database.rollups import ensure_rollups_fresh
+from database.schema import (
+    Product, SaleOrder, SaleOrderItem, StockMovement, DailyProductSales
+)
 
 # Import other tools
 from tools.stock_analysis import detect_stock_rupture, analyze_slow_moving_stock
 from tools.loss_detection import detect_stock_losses, get_explicit_losses
 from tools.purchase_suggestions import suggest_purchase_order
 from tools.stockout_risk import detect_imminent_stockout_risk
+from tools._cache import DEFAULT_TTL_SECONDS, ttl_lru_cache
+
+# Sub-tools queried concurrently by get_stock_alerts (one session each).
+# SQLite queries are CPU-bound in-process, so threads only pay off on a
+# database server; default to one background worker on SQLite.
+ALERT_TOOL_WORKERS = int(os.getenv('ALERT_TOOL_WORKERS', '1' if 'sqlite' in DATABASE_URL else '8'))
+
+# Catalog aggregates change slowly; reuse them for a minute across
+# dashboard refreshes (clear with tools._cache.clear_all_caches())
+SUMMARY_TTL_SECONDS = min(DEFAULT_TTL_SECONDS, 60)
+
+# Health score points lost per alert
+HEALTH_PENALTIES = {
+    'critical': 15,
+    'warning': 5
+}
 
 
 def get_stock_alerts() -> Dict[str, Any]:
@@ -36,27 +57,46 @@ def get_stock_alerts() -> Dict[str, Any]:
             - alerts_count: Total number of alerts
         - critical_alerts: List of critical issues requiring immediate action
         - warnings: List of important issues requiring attention
+          (warnings of the same type are contiguous)
         - recommendations: List of suggested actions
         - metrics: Key performance indicators
     
+    Parts of the response are cached, so one response can mix data of
+    different ages:
+    - summary totals and 30-day sales: up to SUMMARY_TTL_SECONDS (60s)
+    - rupture, slow-moving, stockout risk and purchase suggestions: up to
+      TOOL_CACHE_TTL_SECONDS (300s by default)
+    - low-stock/high-demand products and losses: queried on every call
+    Call tools._cache.clear_all_caches() to get fresh figures everywhere.
+    
     Example:
         >>> alerts = get_stock_alerts()
         >>> print(f"Critical issues: {len(alerts['critical_alerts'])}")
         >>> for alert in alerts['critical_alerts']:
         >>>     print(f"- {alert['message']}")
     """
-    session = SessionLocal()
+    executor = ThreadPoolExecutor(max_workers=ALERT_TOOL_WORKERS)
     
     try:
-        # === SUMMARY METRICS ===
-        total_products = session.query(Product).filter(Product.is_active == True).count()
-        products_with_stock = session.query(Product).filter(
-            and_(Product.is_active == True, Product.current_stock > 0)
-        ).count()
+        # === START SUB-TOOLS ===
+        # The tools are independent and each opens its own session, so they
+        # run concurrently while the summary metrics below are computed.
+        futures = {
+            'stockout_risks': executor.submit(detect_imminent_stockout_risk, days_forecast=30, min_days_threshold=7),
+            'ruptures': executor.submit(detect_stock_rupture, days_lookback=14),
+            'slow_moving': executor.submit(analyze_slow_moving_stock, days_threshold=60),
+            'losses': executor.submit(detect_stock_losses, tolerance_percentage=5.0, limit=3),
+            'purchase_suggestions': executor.submit(suggest_purchase_order, days_forecast=30),
+            'explicit_losses': executor.submit(get_explicit_losses, days_period=30),
+            'low_stock': executor.submit(_low_stock_high_demand, days=7),
+            'sales_30d': executor.submit(_sales_revenue_since, days=30)
+        }
         
-        total_stock_value = session.query(
-            func.sum(Product.current_stock * Product.cost_price)
-        ).filter(Product.is_active == True).scalar() or 0
+        # === SUMMARY METRICS ===
+        stock_summary = _stock_summary()
+        total_products = stock_summary['total_products']
+        products_with_stock = stock_summary['products_with_stock']
+        total_stock_value = stock_summary['total_stock_value']
         
         # === COLLECT ALERTS FROM ALL TOOLS ===
         critical_alerts = []
@@ -64,7 +104,7 @@ def get_stock_alerts() -> Dict[str, Any]:
         recommendations = []
         
         # 1. Imminent Stockout Risk (Critical - PREVENTIVE)
-        stockout_risks = detect_imminent_stockout_risk(days_forecast=30, min_days_threshold=7)
+        stockout_risks = futures['stockout_risks'].result()
         critical_risks = [r for r in stockout_risks if r['risk_level'] in ['CRITICAL', 'HIGH']]
         
         for risk in critical_risks[:5]:  # Top 5 most critical
@@ -80,7 +120,7 @@ def get_stock_alerts() -> Dict[str, Any]:
             })
         
         # 2. Stock Ruptures (Critical - REACTIVE)
-        ruptures = detect_stock_rupture(days_lookback=14)
+        ruptures = futures['ruptures'].result()
         for rupture in ruptures[:5]:  # Top 5 most critical
             critical_alerts.append({
                 'type': 'STOCK_RUPTURE',
@@ -93,7 +133,7 @@ def get_stock_alerts() -> Dict[str, Any]:
             })
         
         # 3. Slow-Moving Stock (Warning)
-        slow_moving = analyze_slow_moving_stock(days_threshold=60)
+        slow_moving = futures['slow_moving'].result()
         urgent_slow = [s for s in slow_moving if 'URGENT' in s['recommendation']]
         
         for item in urgent_slow[:3]:  # Top 3 most urgent
@@ -108,8 +148,8 @@ def get_stock_alerts() -> Dict[str, Any]:
             })
         
         # 4. Stock Losses (Critical if found)
-        losses = detect_stock_losses(tolerance_percentage=5.0)
-        for loss in losses[:3]:  # Top 3 discrepancies
+        losses = futures['losses'].result()
+        for loss in losses:  # Top 3 discrepancies
             critical_alerts.append({
                 'type': 'STOCK_LOSS',
                 'severity': 'CRITICAL',
@@ -121,47 +161,22 @@ def get_stock_alerts() -> Dict[str, Any]:
             })
         
         # 5. Low Stock on High-Demand Products (Warning - now mostly covered by imminent stockout)
-        session_db = SessionLocal()
-        try:
-            # Get products sold recently
-            recent_sales = session_db.query(
-                Product.id,
-                Product.name,
-                Product.current_stock,
-                Product.sale_price,
-                func.sum(SaleOrderItem.quantity).label('qty_sold')
-            ).join(
-                SaleOrderItem, Product.id == SaleOrderItem.product_id
-            ).join(
-                SaleOrder, SaleOrderItem.sale_order_id == SaleOrder.id
-            ).filter(
-                and_(
-                    SaleOrder.sale_date >= (datetime.now() - timedelta(days=7)).date(),
-                    SaleOrder.status == 'PAID'
-                )
-            ).group_by(
-                Product.id, Product.name, Product.current_stock, Product.sale_price
-            ).all()
-            
-            for item in recent_sales:
-                daily_demand = float(item.qty_sold) / 7
-                days_of_stock = float(item.current_stock) / daily_demand if daily_demand > 0 else 999
-                
-                if 0 < days_of_stock < 7 and item.current_stock > 0:  # Less than a week of stock
-                    warnings.append({
-                        'type': 'LOW_STOCK_HIGH_DEMAND',
-                        'severity': 'MEDIUM',
-                        'product_id': item.id,
-                        'product_name': item.name,
-                        'message': f"🟡 {item.name} - Low stock for high-demand product",
-                        'detail': f"Only {days_of_stock:.1f} days of stock remaining (current: {item.current_stock:.0f} units)",
-                        'action': 'Replenish stock urgently'
-                    })
-        finally:
-            session_db.close()
+        low_stock = futures['low_stock'].result()
+        
+        for item in low_stock:
+            days_of_stock = float(item.current_stock) / (float(item.qty_sold) / 7)
+            warnings.append({
+                'type': 'LOW_STOCK_HIGH_DEMAND',
+                'severity': 'MEDIUM',
+                'product_id': item.id,
+                'product_name': item.name,
+                'message': f"🟡 {item.name} - Low stock for high-demand product",
+                'detail': f"Only {days_of_stock:.1f} days of stock remaining (current: {item.current_stock:.0f} units)",
+                'action': 'Replenish stock urgently'
+            })
         
         # 6. Purchase Recommendations
-        purchase_suggestions = suggest_purchase_order(days_forecast=30)
+        purchase_suggestions = futures['purchase_suggestions'].result()
         high_priority = [p for p in purchase_suggestions if p['priority'] == 'HIGH']
         
         if high_priority:
@@ -173,7 +188,7 @@ def get_stock_alerts() -> Dict[str, Any]:
             })
         
         # 7. Explicit Losses
-        explicit_losses = get_explicit_losses(days_period=30)
+        explicit_losses = futures['explicit_losses'].result()
         if explicit_losses:
             total_loss_value = sum(l['loss_value'] for l in explicit_losses)
             warnings.append({
@@ -186,25 +201,10 @@ def get_stock_alerts() -> Dict[str, Any]:
         
         # === KEY METRICS ===
         # Stock turnover rate (last 30 days)
-        sales_30d = session.query(
-            func.sum(SaleOrderItem.quantity * SaleOrderItem.unit_price)
-        ).join(
-            SaleOrder, SaleOrderItem.sale_order_id == SaleOrder.id
-        ).filter(
-            and_(
-                SaleOrder.sale_date >= (datetime.now() - timedelta(days=30)).date(),
-                SaleOrder.status == 'PAID'
-            )
-        ).scalar() or 0
+        sales_30d = futures['sales_30d'].result()
         
         # Products below minimum stock
-        below_min = session.query(Product).filter(
-            and_(
-                Product.is_active == True,
-                Product.current_stock < Product.min_stock,
-                Product.min_stock > 0
-            )
-        ).count()
+        below_min = stock_summary['below_min_stock']
         
         metrics = {
             'total_products': total_products,
@@ -218,11 +218,11 @@ def get_stock_alerts() -> Dict[str, Any]:
             'purchase_recommendations': len(purchase_suggestions)
         }
         
-        # Overall health score (0-100)
+        # Overall health score (0-100), from the alert counts
         health_score = 100
-        health_score -= len(critical_alerts) * 15  # -15 per critical
-        health_score -= len(warnings) * 5  # -5 per warning
-        health_score = max(0, health_score)
+        health_score -= len(critical_alerts) * HEALTH_PENALTIES['critical']
+        health_score -= len(warnings) * HEALTH_PENALTIES['warning']
+        health_score = max(0, min(100, health_score))
         
         if health_score >= 80:
             health_status = "EXCELLENT"
@@ -249,5 +249,115 @@ def get_stock_alerts() -> Dict[str, Any]:
             'metrics': metrics
         }
         
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _low_stock_high_demand(days: int) -> List[Any]:
+    """
+    Find products in stock with less than `days` days of recent demand left.
+    
+    Daily demand is the paid quantity sold over the last `days` days
+    divided by `days`; the filter runs in the database (HAVING), so only
+    flagged products are returned.
+    
+    Args:
+        days: Demand window and stock coverage threshold in days
+    
+    Returns:
+        Rows with id, name, current_stock and qty_sold
+    """
+    session = SessionLocal()
+    
+    try:
+        qty_sold = func.sum(SaleOrderItem.quantity)
+        
+        # Core select: plain rows, no ORM entity loading
+        stmt = select(
+            Product.id,
+            Product.name,
+            Product.current_stock,
+            qty_sold.label('qty_sold')
+        ).join(
+            SaleOrderItem, Product.id == SaleOrderItem.product_id
+        ).join(
+            SaleOrder, SaleOrderItem.sale_order_id == SaleOrder.id
+        ).where(
+            and_(
+                SaleOrder.sale_date >= (datetime.now() - timedelta(days=days)).date(),
+                SaleOrder.status == 'PAID'
+            )
+        ).group_by(
+            Product.id, Product.name, Product.current_stock
+        ).having(
+            and_(
+                Product.current_stock > 0,
+                qty_sold > 0,
+                Product.current_stock / (qty_sold / float(days)) < days
+            )
+        )
+        
+        return session.execute(stmt).all()
+        
+    finally:
+        session.close()
+
+
+@ttl_lru_cache(ttl_seconds=SUMMARY_TTL_SECONDS)
+def _stock_summary() -> Dict[str, Any]:
+    """
+    Compute the catalog-wide stock aggregates in a single scan.
+    
+    Returns:
+        Dictionary with total_products, products_with_stock,
+        total_stock_value and below_min_stock (active products only)
+    """
+    session = SessionLocal()
+    
+    try:
+        row = session.query(
+            func.count(Product.id).label('total_products'),
+            func.sum(case((Product.current_stock > 0, 1), else_=0)).label('products_with_stock'),
+            func.sum(Product.current_stock * Product.cost_price).label('total_stock_value'),
+            func.sum(case(
+                (and_(Product.current_stock < Product.min_stock, Product.min_stock > 0), 1),
+                else_=0
+            )).label('below_min_stock')
+        ).filter(Product.is_active == True).one()
+        
+        return {
+            'total_products': row.total_products,
+            'products_with_stock': int(row.products_with_stock or 0),
+            'total_stock_value': row.total_stock_value or 0,
+            'below_min_stock': int(row.below_min_stock or 0)
+        }
+        
+    finally:
+        session.close()
+
+
+@ttl_lru_cache(ttl_seconds=SUMMARY_TTL_SECONDS)
+def _sales_revenue_since(days: int) -> float:
+    """
+    Sum the paid sales revenue of the last `days` days in the database.
+    
+    Args:
+        days: Number of days to look back
+    
+    Returns:
+        Total revenue (0 when there were no sales)
+    """
+    ensure_rollups_fresh()
+    session = SessionLocal()
+    
+    try:
+        revenue = session.query(
+            func.sum(DailyProductSales.revenue)
+        ).filter(
+            DailyProductSales.sale_date >= (datetime.now() - timedelta(days=days)).date()
+        ).scalar()
+        
+        return float(revenue or 0)
+        
     finally:
         session.close()
@@ -7,8 +7,10 @@ product availability issues and patterns.
 
 from datetime import datetime, timedelta
 from decimal import Decimal
-from typing import List, Dict, Any
-from sqlalchemy import func, and_, or_
+from itertools import groupby
+from operator import itemgetter
+from typing import List, Dict, Any, Tuple
+from sqlalchemy import func, and_, or_, case, select
 from sqlalchemy.orm import Session
 
 from database.connection import SessionLocal
@@ -53,77 +55,71 @@ def detect_availability_issues(days_period: int = 90) -> List[Dict[str, Any]]:
     session = SessionLocal()
     
     try:
-        cutoff_date = datetime.now() - timedelta(days=days_period)
+        now = datetime.now()
+        cutoff_date = now - timedelta(days=days_period)
         
-        # Get all products that have had sales
-        products_with_sales = session.query(Product.id).join(
-            SaleOrderItem, Product.id == SaleOrderItem.product_id
+        # Products sold in the period with their paid quantity, in one query
+        sales = select(
+            SaleOrderItem.product_id,
+            func.sum(case((SaleOrder.status == 'PAID', SaleOrderItem.quantity))).label('total_sales')
         ).join(
             SaleOrder, SaleOrderItem.sale_order_id == SaleOrder.id
-        ).filter(
+        ).where(
             SaleOrder.sale_date >= cutoff_date.date()
-        ).distinct().all()
+        ).group_by(SaleOrderItem.product_id).subquery()
         
-        product_ids = [p.id for p in products_with_sales]
+        candidates = session.execute(
+            select(
+                Product.id,
+                Product.sku,
+                Product.name,
+                Product.category,
+                Product.current_stock,
+                sales.c.total_sales
+            ).join(
+                sales, Product.id == sales.c.product_id
+            ).order_by(Product.id)
+        ).all()
         
-        results = []
+        product_ids = [candidate.id for candidate in candidates]
         
-        for product_id in product_ids:
-            product = session.query(Product).filter(Product.id == product_id).first()
-            
-            if not product:
-                continue
-            
-            # Get all stock movements that resulted in zero stock
-            stockout_movements = session.query(StockMovement).filter(
+        # Streamed in batches and consumed group by group
+        movements = session.execute(
+            select(
+                StockMovement.product_id,
+                StockMovement.movement_date,
+                StockMovement.stock_after
+            ).where(
                 and_(
-                    StockMovement.product_id == product_id,
-                    StockMovement.stock_after == 0,
+                    StockMovement.product_id.in_(product_ids),
                     StockMovement.movement_date >= cutoff_date
                 )
-            ).order_by(StockMovement.movement_date).all()
+            ).order_by(
+                StockMovement.product_id, StockMovement.movement_date, StockMovement.id
+            ).execution_options(yield_per=5000)
+        )
+        
+        stockouts_by_product = {
+            product_id: _stockout_periods(rows, now)
+            for product_id, rows in groupby(movements, key=itemgetter(0))
+        }
+        
+        results = []
+        sort_keys = []  # (severity rank, -lost sales) per result
+        
+        for product in candidates:
+            # Stock-out events and days out of stock in the period
+            stockout_events, total_days_out = stockouts_by_product.get(product.id, (0, 0))
             
-            if not stockout_movements:
+            if not stockout_events:
                 continue  # No stockouts in period
             
-            # Calculate stockout periods
-            stockout_events = len(stockout_movements)
-            total_days_out = 0
-            
-            for stockout in stockout_movements:
-                # Find next stock-in movement
-                next_stock_in = session.query(StockMovement).filter(
-                    and_(
-                        StockMovement.product_id == product_id,
-                        StockMovement.movement_date > stockout.movement_date,
-                        StockMovement.stock_after > 0
-                    )
-                ).order_by(StockMovement.movement_date).first()
-                
-                if next_stock_in:
-                    days_out = (next_stock_in.movement_date - stockout.movement_date).days
-                else:
-                    # Still out of stock
-                    days_out = (datetime.now() - stockout.movement_date).days
-                
-                total_days_out += days_out
-            
             # Calculate availability rate
             availability_rate = ((days_period - total_days_out) / days_period * 100) if days_period > 0 else 0
             
             # Estimate lost sales during stockouts
             # Get average daily sales when in stock
-            total_sales = session.query(
-                func.sum(SaleOrderItem.quantity)
-            ).join(
-                SaleOrder, SaleOrderItem.sale_order_id == SaleOrder.id
-            ).filter(
-                and_(
-                    SaleOrderItem.product_id == product_id,
-                    SaleOrder.sale_date >= cutoff_date.date(),
-                    SaleOrder.status == 'PAID'
-                )
-            ).scalar() or 0
+            total_sales = product.total_sales or 0
             
             days_available = days_period - total_days_out
             avg_daily_sales = float(total_sales) / days_available if days_available > 0 else 0
@@ -133,17 +129,21 @@ def detect_availability_issues(days_period: int = 90) -> List[Dict[str, Any]]:
             # Determine severity
             if availability_rate < 80:
                 issue_severity = "CRITICAL"
+                severity_rank = 0
                 recommendation = "URGENT: Review min/max stock levels and increase safety stock"
             elif availability_rate < 90:
                 issue_severity = "HIGH"
+                severity_rank = 1
                 recommendation = "IMPORTANT: Adjust reorder point and increase order frequency"
             else:
                 issue_severity = "MEDIUM"
+                severity_rank = 2
                 recommendation = "MONITOR: Minor availability issues, optimize reorder timing"
             
             # Current status
             current_status = "IN_STOCK" if product.current_stock > 0 else "OUT_OF_STOCK"
             
+            sort_keys.append((severity_rank, -lost_sales_count))
             results.append({
                 'product_id': product.id,
                 'sku': product.sku,
@@ -158,11 +158,50 @@ def detect_availability_issues(days_period: int = 90) -> List[Dict[str, Any]]:
                 'recommendation': recommendation
             })
         
-        # Sort by severity then by lost sales
-        severity_order = {'CRITICAL': 0, 'HIGH': 1, 'MEDIUM': 2}
-        results.sort(key=lambda x: (severity_order[x['issue_severity']], -x['lost_sales_count']))
-        
-        return results
+        # Sort by severity then by lost sales (keys precomputed, ties by product ID)
+        order = sorted(range(len(results)), key=sort_keys.__getitem__)
+        return [results[i] for i in order]
         
     finally:
-        session.close()
+        session.close()
+
+
+def _stockout_periods(movements, now: datetime) -> Tuple[int, int]:
+    """
+    Count stock-out events and their total duration for one product.
+    
+    Each movement leaving the stock at zero starts a stock-out that lasts
+    until the next later movement with stock above zero (or until now).
+    
+    Args:
+        movements: (product_id, movement_date, stock_after) rows of one
+            product, ordered by movement date
+        now: Reference time for stock-outs that are still open
+    
+    Returns:
+        Tuple (stockout_events, total_days_out)
+    """
+    stockout_events = 0
+    total_days_out = 0
+    open_stockouts = []
+    
+    for _, movement_date, stock_after in movements:
+        if stock_after > 0 and open_stockouts:
+            # Close stock-outs that started strictly before this stock-in
+            still_open = []
+            for started in open_stockouts:
+                if movement_date > started:
+                    total_days_out += (movement_date - started).days
+                else:
+                    still_open.append(started)
+            open_stockouts = still_open
+        
+        if stock_after == 0:
+            stockout_events += 1
+            open_stockouts.append(movement_date)
+    
+    # Still out of stock
+    for started in open_stockouts:
+        total_days_out += (now - started).days
+    
+    return stockout_events, total_days_out
@@ -6,16 +6,25 @@ theft, or discrepancies in inventory.
 """
 
 from datetime import datetime, timedelta
-from decimal import Decimal
-from typing import List, Dict, Any
-from sqlalchemy import func, and_
+from typing import List, Dict, Any, Optional
+from sqlalchemy import func, and_, case
 from sqlalchemy.orm import Session
 
 from database.connection import SessionLocal
 from database.schema import Product, StockMovement
 
+# Severity and recommendation by severity rank (discrepancy >20%, >10%, other)
+_LOSS_SEVERITIES = (
+    ("CRITICAL", "URGENT: Perform physical count and investigate immediately"),
+    ("HIGH", "IMPORTANT: Schedule physical count and review security"),
+    ("MEDIUM", "MONITOR: Review and correct inventory records"),
+)
 
-def detect_stock_losses(tolerance_percentage: float = 5.0) -> List[Dict[str, Any]]:
+
+def detect_stock_losses(
+    tolerance_percentage: float = 5.0,
+    limit: Optional[int] = None
+) -> List[Dict[str, Any]]:
     """
     Detect potential stock losses by analyzing discrepancies.
     
@@ -29,6 +38,7 @@ def detect_stock_losses(tolerance_percentage: float = 5.0) -> List[Dict[str, Any
     
     Args:
         tolerance_percentage: Acceptable variance % before flagging as loss (default: 5%)
+        limit: Return only the top N discrepancies (default: all)
     
     Returns:
         List of dictionaries containing:
@@ -54,79 +64,66 @@ def detect_stock_losses(tolerance_percentage: float = 5.0) -> List[Dict[str, Any
     session = SessionLocal()
     
     try:
-        products = session.query(Product).filter(Product.is_active == True).all()
+        # Expected stock (sum of movements) vs. actual stock, per product
+        expected_stock = func.sum(StockMovement.quantity)
+        discrepancy = expected_stock - Product.current_stock
+        discrepancy_pct = case(
+            (expected_stock != 0, func.abs(discrepancy * 100.0 / expected_stock)),
+            else_=0
+        )
+        estimated_loss_value = func.abs(discrepancy * Product.cost_price)  # At cost price
+        severity_rank = case((discrepancy_pct > 20, 0), (discrepancy_pct > 10, 1), else_=2)
+        
+        # Flag, classify and rank discrepancies in one query
+        query = session.query(
+            Product.id,
+            Product.sku,
+            Product.name,
+            Product.category,
+            Product.current_stock,
+            expected_stock.label('expected_stock'),
+            discrepancy_pct.label('discrepancy_pct'),
+            estimated_loss_value.label('estimated_loss_value'),
+            severity_rank.label('severity_rank'),
+            func.sum(case((StockMovement.movement_type == 'LOSS', 1), else_=0)).label('loss_movements'),
+            func.max(StockMovement.movement_date).label('last_movement_date')
+        ).join(
+            StockMovement, StockMovement.product_id == Product.id  # Skips products with no movements
+        ).filter(
+            Product.is_active == True
+        ).group_by(
+            Product.id
+        ).having(
+            discrepancy_pct > tolerance_percentage  # Only flag beyond tolerance
+        ).order_by(
+            severity_rank, estimated_loss_value.desc(), Product.id
+        )
+        
+        if limit is not None:
+            query = query.limit(limit)
+        
         results = []
         
-        for product in products:
-            # Get all stock movements for this product
-            movements = session.query(StockMovement).filter(
-                StockMovement.product_id == product.id
-            ).order_by(StockMovement.movement_date).all()
-            
-            if not movements:
-                continue  # Skip products with no movements
-            
-            # Calculate expected stock from movements
-            expected_stock = Decimal('0')
-            loss_movements_count = 0
-            
-            for movement in movements:
-                expected_stock += movement.quantity
-                if movement.movement_type == 'LOSS':
-                    loss_movements_count += 1
-            
-            # Compare with actual stock
-            actual_stock = product.current_stock
-            discrepancy = expected_stock - actual_stock
-            
-            # Calculate percentage (avoid division by zero)
-            if expected_stock != 0:
-                discrepancy_pct = abs(float(discrepancy / expected_stock * 100))
-            else:
-                discrepancy_pct = 0
-            
-            # Only flag if discrepancy exceeds tolerance
-            if discrepancy_pct <= tolerance_percentage:
-                continue
-            
-            # Calculate financial impact
-            estimated_loss_value = abs(float(discrepancy * product.cost_price))
-            
-            # Get last movement date
-            last_movement = movements[-1]
-            last_movement_date = last_movement.movement_date
-            
-            # Determine severity
-            if discrepancy_pct > 20:
-                severity = "CRITICAL"
-                recommendation = "URGENT: Perform physical count and investigate immediately"
-            elif discrepancy_pct > 10:
-                severity = "HIGH"
-                recommendation = "IMPORTANT: Schedule physical count and review security"
-            else:
-                severity = "MEDIUM"
-                recommendation = "MONITOR: Review and correct inventory records"
+        for product in query.all():
+            severity, recommendation = _LOSS_SEVERITIES[product.severity_rank]
+            last_movement_date = product.last_movement_date
             
             results.append({
                 'product_id': product.id,
                 'sku': product.sku,
                 'name': product.name,
                 'category': product.category or 'N/A',
-                'current_stock': float(actual_stock),
-                'expected_stock': float(expected_stock),
-                'discrepancy': float(discrepancy),
-                'discrepancy_percentage': round(discrepancy_pct, 2),
-                'estimated_loss_value': round(estimated_loss_value, 2),
+                'current_stock': float(product.current_stock),
+                'expected_stock': float(product.expected_stock),
+                'discrepancy': float(product.expected_stock - product.current_stock),
+                'discrepancy_percentage': round(float(product.discrepancy_pct), 2),
+                'estimated_loss_value': round(float(product.estimated_loss_value), 2),
                 'last_movement_date': last_movement_date.isoformat() if last_movement_date else None,
-                'loss_movements': loss_movements_count,
+                'loss_movements': int(product.loss_movements),
                 'severity': severity,
                 'recommendation': recommendation
             })
         
-        # Sort by severity then by loss value
-        severity_order = {'CRITICAL': 0, 'HIGH': 1, 'MEDIUM': 2}
-        results.sort(key=lambda x: (severity_order[x['severity']], -x['estimated_loss_value']))
-        
         return results
         
     finally:
@@ -163,9 +160,10 @@ def get_explicit_losses(days_period: int = 90) -> List[Dict[str, Any]]:
     session = SessionLocal()
     
     try:
-        cutoff_date = datetime.now() - timedelta(days=days_period)
+        now = datetime.now()
+        cutoff_date = now - timedelta(days=days_period)
         
-        # Query loss movements
+        # Query loss movements (streamed in batches, not materialized)
         losses = session.query(
             StockMovement.id,
             StockMovement.product_id,
@@ -185,13 +183,13 @@ def get_explicit_losses(days_period: int = 90) -> List[Dict[str, Any]]:
             )
         ).order_by(
             StockMovement.movement_date.desc()
-        ).all()
+        ).yield_per(1000)
         
         results = []
         for loss in losses:
             quantity_lost = abs(float(loss.quantity))
             loss_value = quantity_lost * float(loss.unit_cost) if loss.unit_cost else 0
-            days_ago = (datetime.now() - loss.movement_date).days
+            days_ago = (now - loss.movement_date).days
             
             results.append({
                 'movement_id': loss.id,
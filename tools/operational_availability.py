@@ -8,7 +8,7 @@ not restocked on shelves, or display problems.
 
 from datetime import datetime, timedelta
 from decimal import Decimal
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from sqlalchemy import func, and_
 from sqlalchemy.orm import Session
 
@@ -75,34 +75,57 @@ def detect_operational_availability_issues(
     try:
         # Define date ranges
         today = datetime.now()
+        today_date = today.date()
         recent_start = today - timedelta(days=recent_period_days)
         historical_end = today - timedelta(days=recent_period_days)
         historical_start = historical_end - timedelta(days=historical_period_days)
         
-        # Get all products with stock
-        products = session.query(Product).filter(
+        # Get all products with stock (plain rows, only the columns used)
+        products = session.query(
+            Product.id,
+            Product.sku,
+            Product.name,
+            Product.category,
+            Product.current_stock,
+            Product.sale_price
+        ).filter(
             and_(
                 Product.is_active == True,
                 Product.current_stock > 0
             )
         ).all()
         
-        issues = []
+        # Paid sales per product in the historical and recent periods
+        # (products selling under 0.5 units/day historically are left out in SQL)
+        historical_sales_by_product = _paid_sales_by_product(
+            session, historical_start.date(), historical_end.date(),
+            min_quantity=0.5 * historical_period_days
+        )
+        recent_sales_by_product = _paid_sales_by_product(session, recent_start.date())
         
-        for product in products:
-            # Calculate historical sales (30-90 days ago)
-            historical_sales = session.query(
-                func.sum(SaleOrderItem.quantity).label('total')
+        # Latest receipt of each product (to rule out discontinued products)
+        last_receipts = {
+            row.product_id: row for row in session.query(
+                StockMovement.product_id,
+                func.max(PurchaseOrder.received_date).label('received_date'),
+                func.max(StockMovement.movement_date).label('movement_date')
             ).join(
-                SaleOrder, SaleOrderItem.sale_order_id == SaleOrder.id
-            ).filter(
+                PurchaseOrder,
                 and_(
-                    SaleOrderItem.product_id == product.id,
-                    SaleOrder.sale_date >= historical_start.date(),
-                    SaleOrder.sale_date < historical_end.date(),
-                    SaleOrder.status == 'PAID'
+                    StockMovement.reference_id == PurchaseOrder.id,
+                    StockMovement.movement_type == 'PURCHASE'
                 )
-            ).scalar() or 0
+            ).filter(
+                PurchaseOrder.status == 'RECEIVED'
+            ).group_by(StockMovement.product_id).all()
+        }
+        
+        issues = []
+        sort_keys = []  # (severity rank, -lost revenue) per issue
+        
+        for product in products:
+            # Calculate historical sales
+            historical_sales = historical_sales_by_product.get(product.id) or 0
             
             historical_daily_sales = float(historical_sales) / historical_period_days if historical_sales > 0 else 0
             
@@ -111,21 +134,7 @@ def detect_operational_availability_issues(
                 continue
             
             # Calculate recent sales (last 14 days)
-            recent_sales = session.query(
-                func.sum(SaleOrderItem.quantity).label('total'),
-                func.count(func.distinct(SaleOrder.id)).label('count')
-            ).join(
-                SaleOrder, SaleOrderItem.sale_order_id == SaleOrder.id
-            ).filter(
-                and_(
-                    SaleOrderItem.product_id == product.id,
-                    SaleOrder.sale_date >= recent_start.date(),
-                    SaleOrder.status == 'PAID'
-                )
-            ).first()
-            
-            recent_total_sales = float(recent_sales.total or 0)
-            recent_sales_count = recent_sales.count or 0
+            recent_total_sales = float(recent_sales_by_product.get(product.id) or 0)
             recent_daily_sales = recent_total_sales / recent_period_days
             
             # Calculate sales drop
@@ -138,30 +147,14 @@ def detect_operational_availability_issues(
             if sales_drop_percentage < drop_threshold_percentage:
                 continue
             
-            # Check if product received stock recently (to rule out discontinued)
-            last_receipt = session.query(
-                PurchaseOrder.received_date,
-                StockMovement.movement_date
-            ).join(
-                StockMovement,
-                and_(
-                    StockMovement.reference_id == PurchaseOrder.id,
-                    StockMovement.movement_type == 'PURCHASE'
-                )
-            ).filter(
-                and_(
-                    StockMovement.product_id == product.id,
-                    PurchaseOrder.status == 'RECEIVED'
-                )
-            ).order_by(PurchaseOrder.received_date.desc()).first()
-            
             # Only flag if product received stock in last 30 days
             # (otherwise might be discontinued)
+            last_receipt = last_receipts.get(product.id)
             if not last_receipt:
                 continue
             
             last_received_date = last_receipt.received_date or last_receipt.movement_date.date()
-            days_since_received = (datetime.now().date() - last_received_date).days
+            days_since_received = (today_date - last_received_date).days
             
             if days_since_received > 30:
                 continue
@@ -175,14 +168,20 @@ def detect_operational_availability_issues(
             # Determine severity
             if sales_drop_percentage >= 90:
                 issue_severity = "CRITICAL"
+                severity_rank = 0
                 recommendation = "URGENT: Check if product is available on shelves/online. Likely stuck in depot or not restocked."
             elif sales_drop_percentage >= 80:
                 issue_severity = "HIGH"
+                severity_rank = 1
                 recommendation = "IMPORTANT: Verify product visibility and accessibility to customers."
             else:
                 issue_severity = "MEDIUM"
+                severity_rank = 2
                 recommendation = "MONITOR: Sales significantly below normal. Check merchandising and display."
             
+            potential_lost_revenue = round(potential_lost_revenue, 2)
+            
+            sort_keys.append((severity_rank, -potential_lost_revenue))
             issues.append({
                 'product_id': product.id,
                 'sku': product.sku,
@@ -197,16 +196,52 @@ def detect_operational_availability_issues(
                 'lost_sales': round(lost_sales, 1),
                 'last_received_date': last_received_date.isoformat(),
                 'days_since_received': days_since_received,
-                'potential_lost_revenue': round(potential_lost_revenue, 2),
+                'potential_lost_revenue': potential_lost_revenue,
                 'issue_severity': issue_severity,
                 'recommendation': recommendation
             })
         
-        # Sort by severity then by lost revenue
-        severity_order = {'CRITICAL': 0, 'HIGH': 1, 'MEDIUM': 2}
-        issues.sort(key=lambda x: (severity_order[x['issue_severity']], -x['potential_lost_revenue']))
-        
-        return issues
+        # Sort by severity then by lost revenue (keys precomputed, stable for ties)
+        order = sorted(range(len(issues)), key=sort_keys.__getitem__)
+        return [issues[i] for i in order]
         
     finally:
         session.close()
+
+
+def _paid_sales_by_product(
+    session: Session,
+    start_date,
+    end_date=None,
+    min_quantity: Optional[float] = None
+) -> Dict[int, Any]:
+    """
+    Sum the paid quantity sold per product in [start_date, end_date).
+    
+    Args:
+        session: Open database session
+        start_date: First sale date included
+        end_date: First sale date excluded (default: no upper bound)
+        min_quantity: Leave out products that sold less (default: keep all)
+    
+    Returns:
+        Dictionary mapping product_id to quantity sold
+    """
+    conditions = [SaleOrder.sale_date >= start_date, SaleOrder.status == 'PAID']
+    if end_date is not None:
+        conditions.append(SaleOrder.sale_date < end_date)
+    
+    quantity = func.sum(SaleOrderItem.quantity)
+    query = session.query(
+        SaleOrderItem.product_id,
+        quantity
+    ).join(
+        SaleOrder, SaleOrderItem.sale_order_id == SaleOrder.id
+    ).filter(
+        and_(*conditions)
+    ).group_by(SaleOrderItem.product_id)
+    
+    if min_quantity is not None:
+        query = query.having(quantity >= min_quantity)
+    
+    return dict(query.all())
@@ -5,16 +5,28 @@ This module contains tools for analyzing product profitability,
 margins, and return on investment.
 """
 
+import heapq
 from datetime import datetime, timedelta
 from decimal import Decimal
+from operator import itemgetter
 from typing import List, Dict, Any
+import numpy as np
 from sqlalchemy import func, and_
 from sqlalchemy.orm import Session
 
 from database.connection import SessionLocal
 from database.schema import Product, SaleOrder, SaleOrderItem, PurchaseOrder, PurchaseOrderItem
+from tools._cache import ttl_lru_cache
 
+_PROFITABILITY_RECOMMENDATIONS = {
+    'HIGH': "Excellent margins - maintain pricing and promote heavily",
+    'MEDIUM': "Good margins - consider increasing volume through promotions",
+    'LOW': "Low margins - review pricing or negotiate better supplier costs",
+    'POOR': "Poor/negative margins - urgent review needed: increase price or discontinue"
+}
 
+
+@ttl_lru_cache(shared=True)
 def calculate_profitability_analysis(
     period: str = 'month',
     min_sales: int = 1
@@ -55,25 +67,32 @@ def calculate_profitability_analysis(
     session = SessionLocal()
     
     try:
+        now = datetime.now()
+        
         # Determine date range
         if period == 'week':
-            cutoff_date = datetime.now() - timedelta(days=7)
+            cutoff_date = now - timedelta(days=7)
         elif period == 'month':
-            cutoff_date = datetime.now() - timedelta(days=30)
+            cutoff_date = now - timedelta(days=30)
         elif period == 'quarter':
-            cutoff_date = datetime.now() - timedelta(days=90)
+            cutoff_date = now - timedelta(days=90)
         else:  # 'all'
             cutoff_date = datetime.min
         
-        # Query sales data with costs
+        revenue = func.sum(SaleOrderItem.quantity * SaleOrderItem.unit_price)
+        quantity = func.sum(SaleOrderItem.quantity)
+        cost = func.sum(SaleOrderItem.quantity * Product.cost_price)  # No per-sale cost is recorded
+        
+        # Query sales data with costs, most profitable first
         sales_data = session.query(
             Product.id,
             Product.sku,
             Product.name,
             Product.category,
             Product.cost_price,
-            func.sum(SaleOrderItem.quantity * SaleOrderItem.unit_price).label('total_revenue'),
-            func.sum(SaleOrderItem.quantity).label('units_sold'),
+            revenue.label('total_revenue'),
+            quantity.label('units_sold'),
+            cost.label('total_cost'),
             func.avg(SaleOrderItem.unit_price).label('avg_sale_price')
         ).join(
             SaleOrderItem, Product.id == SaleOrderItem.product_id
@@ -85,67 +104,66 @@ def calculate_profitability_analysis(
                 SaleOrder.status == 'PAID'
             )
         ).group_by(
-            Product.id,
-            Product.sku,
-            Product.name,
-            Product.category,
-            Product.cost_price
+            Product.id  # Other product columns depend on the primary key
         ).having(
-            func.sum(SaleOrderItem.quantity) >= min_sales
+            quantity >= min_sales
+        ).order_by(
+            (revenue - cost).desc(), Product.id
         ).all()
         
+        # Profit metrics of all products at once
+        total_revenue = np.fromiter((row.total_revenue for row in sales_data), dtype=float, count=len(sales_data))
+        units_sold = np.fromiter((row.units_sold for row in sales_data), dtype=float, count=len(sales_data))
+        total_cost = np.fromiter((row.total_cost for row in sales_data), dtype=float, count=len(sales_data))
+        
+        gross_profit = total_revenue - total_cost
+        
+        zeros = np.zeros(len(sales_data))
+        profit_margin_pct = np.divide(gross_profit, total_revenue, out=zeros.copy(), where=total_revenue > 0) * 100
+        profit_per_unit = np.divide(gross_profit, units_sold, out=zeros.copy(), where=units_sold > 0)
+        roi_percentage = np.divide(gross_profit, total_cost, out=zeros.copy(), where=total_cost > 0) * 100
+        
+        ratings = np.select(
+            [profit_margin_pct >= 40, profit_margin_pct >= 25, profit_margin_pct >= 10],
+            ['HIGH', 'MEDIUM', 'LOW'],
+            default='POOR'
+        )
+        
+        # Round each metric array once, then emit plain Python values
+        rounded = zip(
+            np.round(total_revenue, 2).tolist(),
+            np.round(total_cost, 2).tolist(),
+            np.round(gross_profit, 2).tolist(),
+            np.round(profit_margin_pct, 1).tolist(),
+            np.round(units_sold, 2).tolist(),
+            np.round(profit_per_unit, 2).tolist(),
+            np.round(roi_percentage, 1).tolist(),
+            ratings.tolist()
+        )
+        
         results = []
         
-        for row in sales_data:
-            total_revenue = float(row.total_revenue)
-            units_sold = float(row.units_sold)
-            avg_sale_price = float(row.avg_sale_price)
-            cost_price = float(row.cost_price)
-            
-            # Calculate costs and profit
-            total_cost = units_sold * cost_price
-            gross_profit = total_revenue - total_cost
-            
-            # Calculate margins and ratios
-            profit_margin_pct = (gross_profit / total_revenue * 100) if total_revenue > 0 else 0
-            profit_per_unit = gross_profit / units_sold if units_sold > 0 else 0
-            roi_percentage = (gross_profit / total_cost * 100) if total_cost > 0 else 0
-            
-            # Determine profitability rating
-            if profit_margin_pct >= 40:
-                profitability_rating = "HIGH"
-                recommendation = "Excellent margins - maintain pricing and promote heavily"
-            elif profit_margin_pct >= 25:
-                profitability_rating = "MEDIUM"
-                recommendation = "Good margins - consider increasing volume through promotions"
-            elif profit_margin_pct >= 10:
-                profitability_rating = "LOW"
-                recommendation = "Low margins - review pricing or negotiate better supplier costs"
-            else:
-                profitability_rating = "POOR"
-                recommendation = "Poor/negative margins - urgent review needed: increase price or discontinue"
+        for row, metrics in zip(sales_data, rounded):
+            revenue_r, cost_r, profit_r, margin_r, units_r, per_unit_r, roi_r, rating = metrics
             
             results.append({
                 'product_id': row.id,
                 'sku': row.sku,
                 'name': row.name,
                 'category': row.category or 'N/A',
-                'total_revenue': round(total_revenue, 2),
-                'total_cost': round(total_cost, 2),
-                'gross_profit': round(gross_profit, 2),
-                'profit_margin_pct': round(profit_margin_pct, 1),
-                'units_sold': round(units_sold, 2),
-                'avg_sale_price': round(avg_sale_price, 2),
-                'avg_cost_price': round(cost_price, 2),
-                'profit_per_unit': round(profit_per_unit, 2),
-                'roi_percentage': round(roi_percentage, 1),
-                'profitability_rating': profitability_rating,
-                'recommendation': recommendation
+                'total_revenue': revenue_r,
+                'total_cost': cost_r,
+                'gross_profit': profit_r,
+                'profit_margin_pct': margin_r,
+                'units_sold': units_r,
+                'avg_sale_price': round(float(row.avg_sale_price), 2),
+                'avg_cost_price': round(float(row.cost_price), 2),
+                'profit_per_unit': per_unit_r,
+                'roi_percentage': roi_r,
+                'profitability_rating': rating,
+                'recommendation': _PROFITABILITY_RECOMMENDATIONS[rating]
             })
         
-        # Sort by gross profit (highest first)
-        results.sort(key=lambda x: x['gross_profit'], reverse=True)
-        
         return results
         
     finally:
@@ -193,17 +211,21 @@ def get_profitability_summary(period: str = 'month') -> Dict[str, Any]:
                 'bottom_performers': []
             }
         
-        total_revenue = sum(p['total_revenue'] for p in analysis)
-        total_cost = sum(p['total_cost'] for p in analysis)
-        total_profit = sum(p['gross_profit'] for p in analysis)
+        # Totals and profitable count in a single pass
+        total_revenue = total_cost = total_profit = 0
+        profitable_count = 0
         
-        overall_margin = (total_profit / total_revenue * 100) if total_revenue > 0 else 0
+        for p in analysis:
+            total_revenue += p['total_revenue']
+            total_cost += p['total_cost']
+            total_profit += p['gross_profit']
+            if p['gross_profit'] > 0:
+                profitable_count += 1
         
-        profitable = [p for p in analysis if p['gross_profit'] > 0]
-        unprofitable = [p for p in analysis if p['gross_profit'] <= 0]
+        overall_margin = (total_profit / total_revenue * 100) if total_revenue > 0 else 0
         
         # Top 5 profit makers
-        top_5 = sorted(analysis, key=lambda x: x['gross_profit'], reverse=True)[:5]
+        top_5 = heapq.nlargest(5, analysis, key=itemgetter('gross_profit'))
         top_profit_makers = [{
             'name': p['name'],
             'gross_profit': p['gross_profit'],
@@ -211,7 +233,7 @@ def get_profitability_summary(period: str = 'month') -> Dict[str, Any]:
         } for p in top_5]
         
         # Bottom 5 performers
-        bottom_5 = sorted(analysis, key=lambda x: x['gross_profit'])[:5]
+        bottom_5 = heapq.nsmallest(5, analysis, key=itemgetter('gross_profit'))
         bottom_performers = [{
             'name': p['name'],
             'gross_profit': p['gross_profit'],
@@ -224,8 +246,8 @@ def get_profitability_summary(period: str = 'month') -> Dict[str, Any]:
             'total_profit': round(total_profit, 2),
             'overall_margin_pct': round(overall_margin, 1),
             'products_analyzed': len(analysis),
-            'profitable_products': len(profitable),
-            'unprofitable_products': len(unprofitable),
+            'profitable_products': profitable_count,
+            'unprofitable_products': len(analysis) - profitable_count,
             'top_profit_makers': top_profit_makers,
             'bottom_performers': bottom_performers
         }
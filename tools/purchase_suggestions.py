@@ -5,19 +5,29 @@ This module contains tools for generating optimal purchase
 recommendations based on sales history and demand forecasting.
 """
 
+from collections import defaultdict
 from datetime import datetime, timedelta
 from decimal import Decimal
-from typing import List, Dict, Any
-from sqlalchemy import func, and_
+from typing import List, Dict, Any, Optional
+import numpy as np
+from sqlalchemy import BigInteger, func, and_, cast, select
 from sqlalchemy.orm import Session
 
 from database.connection import SessionLocal
+from database.rollups import ensure_rollups_fresh
 from database.schema import (
     Product, Supplier, PurchaseOrder, PurchaseOrderItem,
-    SaleOrder, SaleOrderItem
+    DailyProductSales
 )
+from tools._cache import ttl_lru_cache
 
+# Priority names by rank (most urgent first) and the largest days until
+# stockout of each rank but the last
+_PRIORITIES = np.array(['HIGH', 'MEDIUM', 'LOW'])
+_PRIORITY_DAY_EDGES = np.array([7, 14])
 
+
+@ttl_lru_cache(shared=True)
 def suggest_purchase_order(
     days_forecast: int = 30,
     days_history: int = 90,
@@ -69,158 +79,166 @@ def suggest_purchase_order(
         >>> total_value = sum(s['order_value'] for s in suggestions)
         >>> print(f"Suggested order total: R$ {total_value:,.2f}")
     """
+    ensure_rollups_fresh()
     session = SessionLocal()
     
     try:
         cutoff_date = datetime.now() - timedelta(days=days_history)
         
-        # Get all active products
-        products = session.query(Product).filter(Product.is_active == True).all()
+        # Paid sales in history period, per product (from the daily rollup)
+        sales_agg = select(
+            DailyProductSales.product_id,
+            func.sum(DailyProductSales.quantity).label('total_sold'),
+            func.max(DailyProductSales.sale_date).label('last_sale')
+        ).where(
+            DailyProductSales.sale_date >= cutoff_date.date()
+        ).group_by(DailyProductSales.product_id).cte('sales_agg')
         
-        suggestions = []
+        # Pending purchase order items, per product
+        pending_agg = select(
+            PurchaseOrderItem.product_id,
+            func.count(PurchaseOrder.id).label('order_count'),
+            func.sum(PurchaseOrderItem.quantity).label('total_quantity')
+        ).join(
+            PurchaseOrder, PurchaseOrder.id == PurchaseOrderItem.purchase_order_id
+        ).where(
+            PurchaseOrder.status == 'PENDING'
+        ).group_by(PurchaseOrderItem.product_id).cte('pending_agg')
         
-        for product in products:
-            # Calculate sales in history period
-            sales_data = session.query(
-                func.sum(SaleOrderItem.quantity).label('total_sold'),
-                func.count(func.distinct(SaleOrder.id)).label('sales_count'),
-                func.max(SaleOrder.sale_date).label('last_sale')
+        # Only active products with sales that fall short of the forecast.
+        # Rounding adds at most 5 units, so the order value bound is safe
+        # and the exact minimum is checked below.
+        stock_needed = sales_agg.c.total_sold / float(days_history) * days_forecast - Product.current_stock
+        candidates = session.execute(
+            select(
+                Product.id,
+                Product.sku,
+                Product.name,
+                Product.category,
+                Product.current_stock,
+                cast(func.round(Product.cost_price * 100), BigInteger).label('cost_cents'),
+                sales_agg.c.total_sold,
+                sales_agg.c.last_sale,
+                pending_agg.c.order_count,
+                pending_agg.c.total_quantity
             ).join(
-                SaleOrder, SaleOrderItem.sale_order_id == SaleOrder.id
-            ).filter(
+                sales_agg, sales_agg.c.product_id == Product.id
+            ).outerjoin(
+                pending_agg, pending_agg.c.product_id == Product.id
+            ).where(
                 and_(
-                    SaleOrderItem.product_id == product.id,
-                    SaleOrder.sale_date >= cutoff_date.date(),
-                    SaleOrder.status == 'PAID'
+                    Product.is_active == True,
+                    sales_agg.c.total_sold > 0,
+                    stock_needed > 0,
+                    (stock_needed * 1.2 + 5) * Product.cost_price >= min_order_value
                 )
-            ).first()
-            
-            total_sold = float(sales_data.total_sold or 0)
-            sales_count = sales_data.sales_count or 0
-            last_sale = sales_data.last_sale
-            
-            # Skip products with no sales history
-            if total_sold == 0:
-                continue
-            
-            # Calculate average daily sales
-            avg_daily_sales = total_sold / days_history
-            
-            # Forecast demand for the next period
-            forecasted_demand = avg_daily_sales * days_forecast
-            
-            # Current stock
-            current_stock = float(product.current_stock)
-            
-            # Calculate stock needed
-            stock_needed = forecasted_demand - current_stock
-            
-            # Skip if we have enough stock
-            if stock_needed <= 0:
-                continue
-            
-            # Add safety buffer (20% extra)
-            safety_buffer = 1.2
-            suggested_quantity = stock_needed * safety_buffer
-            
-            # Round to reasonable quantity
-            if suggested_quantity < 10:
-                suggested_quantity = round(suggested_quantity)
-            elif suggested_quantity < 100:
-                suggested_quantity = round(suggested_quantity / 5) * 5  # Round to nearest 5
-            else:
-                suggested_quantity = round(suggested_quantity / 10) * 10  # Round to nearest 10
-            
-            # Ensure minimum order quantity
-            if suggested_quantity < 1:
-                suggested_quantity = 1
-            
-            # Calculate order value
-            unit_cost = float(product.cost_price)
-            order_value = suggested_quantity * unit_cost
-            
-            # Skip if order value is too low
-            if order_value < min_order_value:
-                continue
+            ).order_by(Product.id)
+        ).all()
+        
+        count = len(candidates)
+        total_sold = np.fromiter((p.total_sold for p in candidates), dtype=np.float64, count=count)
+        current_stock = np.fromiter((p.current_stock for p in candidates), dtype=np.float64, count=count)
+        cost_cents = np.fromiter((p.cost_cents for p in candidates), dtype=np.int64, count=count)
+        pending_quantity = np.fromiter((p.total_quantity or 0 for p in candidates), dtype=np.float64, count=count)
+        
+        # Average daily sales, forecast for the next period and stock needed
+        avg_daily_sales = total_sold / days_history
+        forecasted_demand = avg_daily_sales * days_forecast
+        stock_needed = forecasted_demand - current_stock
+        
+        # Add safety buffer (20% extra) and round to a reasonable quantity:
+        # units below 10, nearest 5 below 100, nearest 10 above (at least 1)
+        buffered = stock_needed * 1.2
+        suggested_quantity = np.where(
+            buffered < 10,
+            np.round(buffered),
+            np.where(buffered < 100, np.round(buffered / 5) * 5, np.round(buffered / 10) * 10)
+        )
+        suggested_quantity = np.maximum(suggested_quantity, 1).astype(np.int64)
+        
+        # Money stays in integer cents, so order values are exact
+        order_value_cents = suggested_quantity * cost_cents
+        
+        # Days until stockout (999 when there is no demand)
+        stockout_days = np.divide(
+            current_stock, avg_daily_sales, out=np.full(count, 999.0), where=avg_daily_sales > 0
+        ).astype(np.int64)
+        
+        # Pending orders are sufficient when they cover the forecast
+        pending_sufficient = (current_stock + pending_quantity) >= forecasted_demand
+        
+        # Priority considering pending orders (LOW when they are sufficient)
+        priority_rank = np.where(
+            pending_sufficient, 2, np.searchsorted(_PRIORITY_DAY_EDGES, stockout_days, side='left')
+        )
+        priorities = _PRIORITIES[priority_rank]
+        
+        # Skip products with enough stock or a too small order, then sort
+        # by priority and order value (stable, so ties keep product order)
+        keep = np.flatnonzero((stock_needed > 0) & (order_value_cents >= min_order_value * 100))
+        keep = keep[np.lexsort((-order_value_cents[keep], priority_rank[keep]))]
+        
+        suggestions = []
+        
+        for i in keep.tolist():
+            product = candidates[i]
+            last_sale = product.last_sale
             
-            # Calculate days until stockout
-            if avg_daily_sales > 0:
-                days_until_stockout = int(current_stock / avg_daily_sales)
-            else:
-                days_until_stockout = 999
+            days_until_stockout = int(stockout_days[i])
             
             # === CHECK PENDING PURCHASE ORDERS ===
-            pending_orders_data = session.query(
-                func.count(PurchaseOrder.id).label('order_count'),
-                func.sum(PurchaseOrderItem.quantity).label('total_quantity')
-            ).join(
-                PurchaseOrderItem, PurchaseOrder.id == PurchaseOrderItem.purchase_order_id
-            ).filter(
-                and_(
-                    PurchaseOrderItem.product_id == product.id,
-                    PurchaseOrder.status == 'PENDING'
-                )
-            ).first()
-            
-            pending_quantity = float(pending_orders_data.total_quantity or 0)
-            pending_count = pending_orders_data.order_count or 0
+            pending_count = product.order_count or 0
             has_pending = pending_count > 0
-            
-            # Check if pending orders are sufficient
-            is_sufficient = (current_stock + pending_quantity) >= forecasted_demand
+            is_sufficient = bool(pending_sufficient[i])
             
             pending_orders = {
                 'has_pending': has_pending,
-                'total_quantity': pending_quantity,
+                'total_quantity': float(pending_quantity[i]),
                 'order_count': pending_count,
                 'is_sufficient': is_sufficient
             }
             
-            # Determine priority (considering pending orders)
-            if days_until_stockout <= 7 and not is_sufficient:
-                priority = "HIGH"
-            elif days_until_stockout <= 14 and not is_sufficient:
-                priority = "MEDIUM"
-            elif not is_sufficient:
-                priority = "LOW"
-            else:
-                priority = "LOW"  # Has sufficient pending orders
-            
             suggestions.append({
                 'product_id': product.id,
                 'sku': product.sku,
                 'name': product.name,
                 'category': product.category or 'N/A',
-                'current_stock': current_stock,
-                'avg_daily_sales': round(avg_daily_sales, 2),
-                'forecasted_demand': round(forecasted_demand, 2),
-                'stock_needed': round(stock_needed, 2),
-                'suggested_quantity': int(suggested_quantity),
-                'unit_cost': unit_cost,
-                'order_value': round(order_value, 2),
-                'priority': priority,
+                'current_stock': float(current_stock[i]),
+                'avg_daily_sales': round(float(avg_daily_sales[i]), 2),
+                'forecasted_demand': round(float(forecasted_demand[i]), 2),
+                'stock_needed': round(float(stock_needed[i]), 2),
+                'suggested_quantity': int(suggested_quantity[i]),
+                'unit_cost': int(cost_cents[i]) / 100,
+                'order_value': int(order_value_cents[i]) / 100,
+                'priority': str(priorities[i]),
                 'last_sale_date': last_sale.isoformat() if last_sale else None,
                 'days_until_stockout': days_until_stockout if days_until_stockout < 999 else None,
                 'pending_orders': pending_orders
             })
         
-        # Sort by priority then by order value
-        priority_order = {'HIGH': 0, 'MEDIUM': 1, 'LOW': 2}
-        suggestions.sort(key=lambda x: (priority_order[x['priority']], -x['order_value']))
-        
         return suggestions
         
     finally:
         session.close()
 
 
-def group_suggestions_by_supplier() -> List[Dict[str, Any]]:
+def group_suggestions_by_supplier(
+    suggestions: Optional[List[Dict[str, Any]]] = None,
+    session: Optional[Session] = None
+) -> List[Dict[str, Any]]:
     """
     Group purchase suggestions by supplier for consolidated orders.
     
     This tool takes purchase suggestions and groups them by supplier,
     making it easier to create actual purchase orders.
     
+    Args:
+        suggestions: Result of suggest_purchase_order() the caller already
+            has, e.g. a dashboard showing both views (default: computed
+            with days_forecast=30)
+        session: Optional session to run in, e.g. one shared by several
+            tool calls (default: a new one)
+    
     Returns:
         List of dictionaries containing:
         - supplier_id: Supplier ID
@@ -235,50 +253,65 @@ def group_suggestions_by_supplier() -> List[Dict[str, Any]]:
         >>> for supplier in grouped:
         >>>     print(f"{supplier['supplier_name']}: R$ {supplier['total_order_value']:,.2f}")
     """
-    session = SessionLocal()
+    # Get suggestions first (cached, so usually no query at all)
+    if suggestions is None:
+        suggestions = suggest_purchase_order(days_forecast=30)
+    
+    if not suggestions:
+        return []
+    
+    own_session = session is None
+    if own_session:
+        session = SessionLocal()
     
     try:
-        # Get suggestions first
-        suggestions = suggest_purchase_order(days_forecast=30)
+        # Last supplier who provided each suggested product, in one query
+        ranked_purchases = select(
+            PurchaseOrderItem.product_id,
+            Supplier.id,
+            Supplier.name,
+            func.row_number().over(
+                partition_by=PurchaseOrderItem.product_id,
+                order_by=(PurchaseOrder.order_date.desc(), PurchaseOrder.id.desc())
+            ).label('purchase_rank')
+        ).join(
+            PurchaseOrder, PurchaseOrder.id == PurchaseOrderItem.purchase_order_id
+        ).join(
+            Supplier, Supplier.id == PurchaseOrder.supplier_id
+        ).where(
+            PurchaseOrderItem.product_id.in_([s['product_id'] for s in suggestions])
+        ).subquery()
         
-        if not suggestions:
-            return []
+        last_suppliers = {
+            row.product_id: row for row in session.execute(
+                select(
+                    ranked_purchases.c.product_id,
+                    ranked_purchases.c.id,
+                    ranked_purchases.c.name
+                ).where(ranked_purchases.c.purchase_rank == 1)
+            )
+        }
         
-        # Get supplier for each product (last supplier who provided it)
-        supplier_groups = {}
+        supplier_groups = defaultdict(lambda: {
+            'supplier_id': None,
+            'supplier_name': None,
+            'products': [],
+            'total_order_value': 0,
+            'high_priority_items': 0
+        })
         
         for suggestion in suggestions:
-            # Find last supplier for this product
-            last_purchase = session.query(
-                Supplier.id,
-                Supplier.name
-            ).join(
-                PurchaseOrder, Supplier.id == PurchaseOrder.supplier_id
-            ).join(
-                PurchaseOrderItem, PurchaseOrder.id == PurchaseOrderItem.purchase_order_id
-            ).filter(
-                PurchaseOrderItem.product_id == suggestion['product_id']
-            ).order_by(
-                PurchaseOrder.order_date.desc()
-            ).first()
+            last_purchase = last_suppliers.get(suggestion['product_id'])
             
             if not last_purchase:
                 # No previous supplier, skip
                 continue
             
-            supplier_id = last_purchase.id
-            supplier_name = last_purchase.name
+            group = supplier_groups[last_purchase.id]
+            group['supplier_id'] = last_purchase.id
+            group['supplier_name'] = last_purchase.name
             
-            if supplier_id not in supplier_groups:
-                supplier_groups[supplier_id] = {
-                    'supplier_id': supplier_id,
-                    'supplier_name': supplier_name,
-                    'products': [],
-                    'total_order_value': 0,
-                    'high_priority_items': 0
-                }
-            
-            supplier_groups[supplier_id]['products'].append({
+            group['products'].append({
                 'product_id': suggestion['product_id'],
                 'sku': suggestion['sku'],
                 'name': suggestion['name'],
@@ -288,10 +321,8 @@ def group_suggestions_by_supplier() -> List[Dict[str, Any]]:
                 'priority': suggestion['priority']
             })
             
-            supplier_groups[supplier_id]['total_order_value'] += suggestion['order_value']
-            
-            if suggestion['priority'] == 'HIGH':
-                supplier_groups[supplier_id]['high_priority_items'] += 1
+            group['total_order_value'] += suggestion['order_value']
+            group['high_priority_items'] += suggestion['priority'] == 'HIGH'
         
         # Convert to list and add products count
         result = []
@@ -305,4 +336,5 @@ def group_suggestions_by_supplier() -> List[Dict[str, Any]]:
         return result
         
     finally:
-        session.close()
+        if own_session:
+            session.close()
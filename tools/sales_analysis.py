@@ -1,269 +1,320 @@
-"""
-Sales analysis tools for AI Agent.
-
-This module contains tools for analyzing sales performance,
-top-selling products, and revenue metrics.
-"""
-
-from datetime import datetime, timedelta
-from decimal import Decimal
-from typing import List, Dict, Any
-from sqlalchemy import func, and_
-from sqlalchemy.orm import Session
-
-from database.connection import SessionLocal
-from database.schema import Product, SaleOrder, SaleOrderItem
-
-
-def get_top_selling_products(
-    period: str = 'month',
-    limit: int = 10,
-    metric: str = 'revenue'
-) -> List[Dict[str, Any]]:
-    """
-    Get top-selling products ranked by various metrics.
-    
-    This tool analyzes sales performance to identify best-selling products
-    by revenue, quantity, or frequency, helping with inventory and marketing decisions.
-    
-    Args:
-        period: Time period to analyze:
-            - 'week': Last 7 days
-            - 'month': Last 30 days (default)
-            - 'quarter': Last 90 days
-            - 'all': All time
-        limit: Maximum number of products to return (default: 10)
-        metric: Ranking metric:
-            - 'revenue': Total revenue generated (default)
-            - 'quantity': Total units sold
-            - 'frequency': Number of separate sales
-    
-    Returns:
-        List of dictionaries containing:
-        - rank: Ranking position
-        - product_id: Product ID
-        - sku: Product SKU
-        - name: Product name
-        - category: Product category
-        - total_revenue: Total revenue generated
-        - total_quantity: Total units sold
-        - sales_count: Number of separate sales
-        - avg_sale_value: Average value per sale
-        - avg_quantity_per_sale: Average quantity per sale
-        - current_stock: Current stock level
-        - stock_status: OK/LOW/OUT based on demand
-        - percentage_of_total: % of total sales (for selected metric)
-    
-    Example:
-        >>> top_revenue = get_top_selling_products(period='month', metric='revenue')
-        >>> print(f"Top seller: {top_revenue[0]['name']} - R$ {top_revenue[0]['total_revenue']:,.2f}")
-    """
-    session = SessionLocal()
-    
-    try:
-        # Determine date range
-        if period == 'week':
-            cutoff_date = datetime.now() - timedelta(days=7)
-        elif period == 'month':
-            cutoff_date = datetime.now() - timedelta(days=30)
-        elif period == 'quarter':
-            cutoff_date = datetime.now() - timedelta(days=90)
-        else:  # 'all'
-            cutoff_date = datetime.min
-        
-        # Query sales data
-        query = session.query(
-            Product.id,
-            Product.sku,
-            Product.name,
-            Product.category,
-            Product.current_stock,
-            Product.sale_price,
-            func.sum(SaleOrderItem.quantity * SaleOrderItem.unit_price).label('total_revenue'),
-            func.sum(SaleOrderItem.quantity).label('total_quantity'),
-            func.count(func.distinct(SaleOrder.id)).label('sales_count'),
-            func.avg(SaleOrderItem.quantity).label('avg_quantity')
-        ).join(
-            SaleOrderItem, Product.id == SaleOrderItem.product_id
-        ).join(
-            SaleOrder, SaleOrderItem.sale_order_id == SaleOrder.id
-        ).filter(
-            and_(
-                SaleOrder.sale_date >= cutoff_date.date(),
-                SaleOrder.status == 'PAID'
-            )
-        ).group_by(
-            Product.id,
-            Product.sku,
-            Product.name,
-            Product.category,
-            Product.current_stock,
-            Product.sale_price
-        )
-        
-        # Order by selected metric
-        if metric == 'revenue':
-            query = query.order_by(func.sum(SaleOrderItem.quantity * SaleOrderItem.unit_price).desc())
-        elif metric == 'quantity':
-            query = query.order_by(func.sum(SaleOrderItem.quantity).desc())
-        elif metric == 'frequency':
-            query = query.order_by(func.count(func.distinct(SaleOrder.id)).desc())
-        
-        results = query.limit(limit).all()
-        
-        # Calculate total for percentage
-        if metric == 'revenue':
-            total_metric = sum(float(r.total_revenue) for r in results)
-        elif metric == 'quantity':
-            total_metric = sum(float(r.total_quantity) for r in results)
-        else:  # frequency
-            total_metric = sum(r.sales_count for r in results)
-        
-        output = []
-        for rank, row in enumerate(results, 1):
-            total_revenue = float(row.total_revenue)
-            total_quantity = float(row.total_quantity)
-            sales_count = row.sales_count
-            avg_quantity = float(row.avg_quantity) if row.avg_quantity else 0
-            
-            # Calculate average sale value
-            avg_sale_value = total_revenue / sales_count if sales_count > 0 else 0
-            
-            # Determine stock status
-            # Simple heuristic: if daily sales * 7 > current stock = LOW
-            days_in_period = 7 if period == 'week' else 30 if period == 'month' else 90
-            if period == 'all':
-                days_in_period = 180  # Assume 6 months for 'all'
-            
-            daily_sales = total_quantity / days_in_period if days_in_period > 0 else 0
-            week_demand = daily_sales * 7
-            
-            current_stock = float(row.current_stock)
-            
-            if current_stock == 0:
-                stock_status = "OUT"
-            elif current_stock < week_demand:
-                stock_status = "LOW"
-            else:
-                stock_status = "OK"
-            
-            # Calculate percentage
-            if metric == 'revenue':
-                metric_value = total_revenue
-            elif metric == 'quantity':
-                metric_value = total_quantity
-            else:
-                metric_value = sales_count
-            
-            percentage = (metric_value / total_metric * 100) if total_metric > 0 else 0
-            
-            output.append({
-                'rank': rank,
-                'product_id': row.id,
-                'sku': row.sku,
-                'name': row.name,
-                'category': row.category or 'N/A',
-                'total_revenue': round(total_revenue, 2),
-                'total_quantity': round(total_quantity, 2),
-                'sales_count': sales_count,
-                'avg_sale_value': round(avg_sale_value, 2),
-                'avg_quantity_per_sale': round(avg_quantity, 2),
-                'current_stock': current_stock,
-                'stock_status': stock_status,
-                'percentage_of_total': round(percentage, 1)
-            })
-        
-        return output
-        
-    finally:
-        session.close()
-
-
-def get_sales_by_category(period: str = 'month') -> List[Dict[str, Any]]:
-    """
-    Get sales performance grouped by product category.
-    
-    This tool provides category-level insights to identify which
-    product categories are performing best.
-    
-    Args:
-        period: Time period to analyze (week/month/quarter/all)
-    
-    Returns:
-        List of dictionaries containing:
-        - category: Category name
-        - products_count: Number of products in category
-        - total_revenue: Total revenue for category
-        - total_quantity: Total units sold
-        - sales_count: Number of sales
-        - avg_product_revenue: Average revenue per product
-        - percentage_of_total: % of total revenue
-    
-    Example:
-        >>> by_category = get_sales_by_category(period='month')
-        >>> top_cat = by_category[0]
-        >>> print(f"Top category: {top_cat['category']} - R$ {top_cat['total_revenue']:,.2f}")
-    """
-    session = SessionLocal()
-    
-    try:
-        # Determine date range
-        if period == 'week':
-            cutoff_date = datetime.now() - timedelta(days=7)
-        elif period == 'month':
-            cutoff_date = datetime.now() - timedelta(days=30)
-        elif period == 'quarter':
-            cutoff_date = datetime.now() - timedelta(days=90)
-        else:  # 'all'
-            cutoff_date = datetime.min
-        
-        # Query sales by category
-        query = session.query(
-            Product.category,
-            func.count(func.distinct(Product.id)).label('products_count'),
-            func.sum(SaleOrderItem.quantity * SaleOrderItem.unit_price).label('total_revenue'),
-            func.sum(SaleOrderItem.quantity).label('total_quantity'),
-            func.count(func.distinct(SaleOrder.id)).label('sales_count')
-        ).join(
-            SaleOrderItem, Product.id == SaleOrderItem.product_id
-        ).join(
-            SaleOrder, SaleOrderItem.sale_order_id == SaleOrder.id
-        ).filter(
-            and_(
-                SaleOrder.sale_date >= cutoff_date.date(),
-                SaleOrder.status == 'PAID'
-            )
-        ).group_by(
-            Product.category
-        ).order_by(
-            func.sum(SaleOrderItem.quantity * SaleOrderItem.unit_price).desc()
-        ).all()
-        
-        # Calculate total revenue
-        total_revenue = sum(float(r.total_revenue) for r in query)
-        
-        results = []
-        for row in query:
-            category = row.category or 'Uncategorized'
-            products_count = row.products_count
-            cat_revenue = float(row.total_revenue)
-            cat_quantity = float(row.total_quantity)
-            sales_count = row.sales_count
-            
-            avg_product_revenue = cat_revenue / products_count if products_count > 0 else 0
-            percentage = (cat_revenue / total_revenue * 100) if total_revenue > 0 else 0
-            
-            results.append({
-                'category': category,
-                'products_count': products_count,
-                'total_revenue': round(cat_revenue, 2),
-                'total_quantity': round(cat_quantity, 2),
-                'sales_count': sales_count,
-                'avg_product_revenue': round(avg_product_revenue, 2),
-                'percentage_of_total': round(percentage, 1)
-            })
-        
-        return results
-        
-    finally:
-        session.close()
+"""
+Sales analysis tools for AI Agent.
+
+This module contains tools for analyzing sales performance,
+top-selling products, and revenue metrics.
+"""
+
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import List, Dict, Any
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, and_, select
+from sqlalchemy.orm import Session
+
+from database.connection import SessionLocal
+from database.rollups import ensure_rollups_fresh
+from database.schema import Product, SaleOrder, SaleOrderItem, DailyProductSales
+from tools._cache import ttl_lru_cache
+
+# Days covered by each period ('all' has no cutoff)
+_PERIOD_DAYS = {'week': 7, 'month': 30, 'quarter': 90}
+
+_SALES_COLUMNS = [
+    'product_id', 'sku', 'name', 'category', 'current_stock',
+    'sale_order_id', 'quantity', 'revenue'
+]
+_METRIC_COLUMNS = [
+    'id', 'sku', 'name', 'category', 'current_stock',
+    'total_revenue', 'total_quantity', 'sales_count', 'avg_quantity'
+]
+
+# Column types of the cached frames: IDs and counts fit in int32,
+# amounts stay float64 so rounded R$ values are exact
+_SALES_DTYPES = {
+    'product_id': np.int32, 'sale_order_id': np.int32,
+    'current_stock': np.float64, 'quantity': np.float64, 'revenue': np.float64
+}
+_METRIC_DTYPES = {
+    'id': np.int32, 'sales_count': np.int32, 'current_stock': np.float64,
+    'total_revenue': np.float64, 'total_quantity': np.float64, 'avg_quantity': np.float64
+}
+
+
+@ttl_lru_cache(shared=True)
+def get_top_selling_products(
+    period: str = 'month',
+    limit: int = 10,
+    metric: str = 'revenue'
+) -> List[Dict[str, Any]]:
+    """
+    Get top-selling products ranked by various metrics.
+    
+    This tool analyzes sales performance to identify best-selling products
+    by revenue, quantity, or frequency, helping with inventory and marketing decisions.
+    
+    Args:
+        period: Time period to analyze:
+            - 'week': Last 7 days
+            - 'month': Last 30 days (default)
+            - 'quarter': Last 90 days
+            - 'all': All time
+        limit: Maximum number of products to return (default: 10)
+        metric: Ranking metric:
+            - 'revenue': Total revenue generated (default)
+            - 'quantity': Total units sold
+            - 'frequency': Number of separate sales
+    
+    Returns:
+        List of dictionaries containing:
+        - rank: Ranking position
+        - product_id: Product ID
+        - sku: Product SKU
+        - name: Product name
+        - category: Product category
+        - total_revenue: Total revenue generated
+        - total_quantity: Total units sold
+        - sales_count: Number of separate sales
+        - avg_sale_value: Average value per sale
+        - avg_quantity_per_sale: Average quantity per sale
+        - current_stock: Current stock level
+        - stock_status: OK/LOW/OUT based on demand
+        - percentage_of_total: % of total sales (for selected metric)
+    
+    Example:
+        >>> top_revenue = get_top_selling_products(period='month', metric='revenue')
+        >>> print(f"Top seller: {top_revenue[0]['name']} - R$ {top_revenue[0]['total_revenue']:,.2f}")
+    """
+    df = _compute_all_metrics(period)
+    
+    if df.empty:
+        return []
+    
+    # Rank by selected metric
+    metric_column = {
+        'revenue': 'total_revenue',
+        'quantity': 'total_quantity',
+        'frequency': 'sales_count'
+    }.get(metric)
+    
+    if metric_column:
+        ranked = df.nlargest(limit, metric_column)
+    else:
+        ranked = df.head(limit)
+    
+    # Determine stock status for all ranked products at once
+    # Simple heuristic: if daily sales * 7 > current stock = LOW
+    # Assume 6 months for 'all'; other unknown periods count as a quarter
+    days_in_period = 180 if period == 'all' else _PERIOD_DAYS.get(period, 90)
+    
+    current_stock = ranked['current_stock'].to_numpy(dtype=float)
+    week_demand = ranked['total_quantity'].to_numpy(dtype=float) / days_in_period * 7
+    stock_status = np.select(
+        [current_stock == 0, current_stock < week_demand],
+        ['OUT', 'LOW'],
+        default='OK'
+    )
+    
+    # Calculate total for percentage (all products sold, not only the ranked ones)
+    if metric == 'revenue':
+        total_metric = float(df['total_revenue'].sum())
+    elif metric == 'quantity':
+        total_metric = float(df['total_quantity'].sum())
+    else:  # frequency
+        total_metric = int(df['sales_count'].sum())
+    
+    # Derive the remaining columns for all ranked products at once
+    total_revenue = ranked['total_revenue'].to_numpy(dtype=float)
+    sales_count = ranked['sales_count'].to_numpy()
+    avg_sale_value = np.divide(total_revenue, sales_count, out=np.zeros(len(ranked)), where=sales_count > 0)
+    
+    metric_values = ranked[metric_column or 'sales_count'].to_numpy(dtype=float)
+    percentage = metric_values / total_metric * 100 if total_metric > 0 else np.zeros(len(ranked))
+    
+    output = pd.DataFrame({
+        'rank': np.arange(1, len(ranked) + 1),
+        'product_id': ranked['id'].to_numpy(),
+        'sku': ranked['sku'].to_numpy(),
+        'name': ranked['name'].to_numpy(),
+        'category': ranked['category'].fillna('').replace('', 'N/A').to_numpy(),
+        'total_revenue': np.round(total_revenue, 2),
+        'total_quantity': np.round(ranked['total_quantity'].to_numpy(dtype=float), 2),
+        'sales_count': sales_count,
+        'avg_sale_value': np.round(avg_sale_value, 2),
+        'avg_quantity_per_sale': np.round(ranked['avg_quantity'].fillna(0).to_numpy(dtype=float), 2),
+        'current_stock': current_stock,
+        'stock_status': stock_status,
+        'percentage_of_total': np.round(percentage, 1)
+    })
+    
+    return output.to_dict('records')
+
+
+@ttl_lru_cache(shared=True)
+def get_sales_by_category(period: str = 'month') -> List[Dict[str, Any]]:
+    """
+    Get sales performance grouped by product category.
+    
+    This tool provides category-level insights to identify which
+    product categories are performing best.
+    
+    Category totals are read from the live sale tables, while
+    get_top_selling_products() ranks from the daily_product_sales rollup
+    snapshot, so sales recorded since the last rollup refresh appear here
+    first.
+    
+    Args:
+        period: Time period to analyze (week/month/quarter/all)
+    
+    Returns:
+        List of dictionaries containing:
+        - category: Category name
+        - products_count: Number of products in category
+        - total_revenue: Total revenue for category
+        - total_quantity: Total units sold
+        - sales_count: Number of sales
+        - avg_product_revenue: Average revenue per product
+        - percentage_of_total: % of total revenue
+    
+    Example:
+        >>> by_category = get_sales_by_category(period='month')
+        >>> top_cat = by_category[0]
+        >>> print(f"Top category: {top_cat['category']} - R$ {top_cat['total_revenue']:,.2f}")
+    """
+    sales = _fetch_sales_rows(period)
+    
+    if sales.empty:
+        return []
+    
+    # Aggregate by category
+    by_category = sales.groupby('category', dropna=False, sort=False).agg(
+        products_count=('product_id', 'nunique'),
+        total_revenue=('revenue', 'sum'),
+        total_quantity=('quantity', 'sum'),
+        sales_count=('sale_order_id', 'nunique')
+    ).reset_index().sort_values('total_revenue', ascending=False, kind='stable')
+    
+    # Calculate total revenue
+    total_revenue = float(by_category['total_revenue'].sum())
+    
+    # Derive the remaining columns for all categories at once
+    products_count = by_category['products_count'].to_numpy()
+    cat_revenue = by_category['total_revenue'].to_numpy(dtype=float)
+    avg_product_revenue = np.divide(cat_revenue, products_count, out=np.zeros(len(by_category)), where=products_count > 0)
+    percentage = cat_revenue / total_revenue * 100 if total_revenue > 0 else np.zeros(len(by_category))
+    
+    results = pd.DataFrame({
+        'category': by_category['category'].fillna('').replace('', 'Uncategorized').to_numpy(),
+        'products_count': products_count,
+        'total_revenue': np.round(cat_revenue, 2),
+        'total_quantity': np.round(by_category['total_quantity'].to_numpy(dtype=float), 2),
+        'sales_count': by_category['sales_count'].to_numpy(),
+        'avg_product_revenue': np.round(avg_product_revenue, 2),
+        'percentage_of_total': np.round(percentage, 1)
+    })
+    
+    return results.to_dict('records')
+
+
+def _period_cutoff(period: str) -> datetime:
+    """Return the start of a period (week/month/quarter/all)."""
+    if period in _PERIOD_DAYS:
+        return datetime.now() - timedelta(days=_PERIOD_DAYS[period])
+    return datetime.min
+
+
+@ttl_lru_cache()
+def _fetch_sales_rows(period: str) -> pd.DataFrame:
+    """
+    Fetch every paid sale item of a period in a single query.
+    
+    Used for category totals: distinct orders per category cannot be
+    summed from the per-product daily rollup.
+    
+    Args:
+        period: Time period to fetch (week/month/quarter/all)
+    
+    Returns:
+        DataFrame with one row per sale item: product_id, sku, name,
+        category, current_stock, sale_order_id, quantity, revenue
+    """
+    session = SessionLocal()
+    
+    try:
+        cutoff_date = _period_cutoff(period)
+        
+        stmt = select(
+            Product.id.label('product_id'),
+            Product.sku,
+            Product.name,
+            Product.category,
+            Product.current_stock,
+            SaleOrderItem.sale_order_id,
+            SaleOrderItem.quantity,
+            (SaleOrderItem.quantity * SaleOrderItem.unit_price).label('revenue')
+        ).join(
+            SaleOrderItem, Product.id == SaleOrderItem.product_id
+        ).join(
+            SaleOrder, SaleOrderItem.sale_order_id == SaleOrder.id
+        ).where(
+            and_(
+                SaleOrder.sale_date >= cutoff_date.date(),
+                SaleOrder.status == 'PAID'
+            )
+        ).order_by(
+            Product.id
+        )
+        
+        sales = pd.DataFrame(session.execute(stmt).all(), columns=_SALES_COLUMNS)
+        return sales.astype(_SALES_DTYPES)
+        
+    finally:
+        session.close()
+
+
+@ttl_lru_cache()
+def _compute_all_metrics(period: str) -> pd.DataFrame:
+    """
+    Aggregate the sales of a period per product for every ranking metric.
+    
+    Reads the daily_product_sales rollup instead of scanning sale items.
+    
+    Args:
+        period: Time period to analyze (week/month/quarter/all)
+    
+    Returns:
+        DataFrame with one row per product (ordered by product ID) with
+        total_revenue, total_quantity, sales_count and avg_quantity columns
+    """
+    ensure_rollups_fresh()
+    session = SessionLocal()
+    
+    try:
+        cutoff_date = _period_cutoff(period)
+        
+        stmt = select(
+            Product.id,
+            Product.sku,
+            Product.name,
+            Product.category,
+            Product.current_stock,
+            func.sum(DailyProductSales.revenue).label('total_revenue'),
+            func.sum(DailyProductSales.quantity).label('total_quantity'),
+            func.sum(DailyProductSales.order_count).label('sales_count'),
+            (func.sum(DailyProductSales.quantity) / func.sum(DailyProductSales.item_count)).label('avg_quantity')
+        ).join(
+            DailyProductSales, Product.id == DailyProductSales.product_id
+        ).where(
+            DailyProductSales.sale_date >= cutoff_date.date()
+        ).group_by(
+            Product.id
+        ).order_by(
+            Product.id
+        )
+        
+        metrics = pd.DataFrame(session.execute(stmt).all(), columns=_METRIC_COLUMNS)
+        return metrics.astype(_METRIC_DTYPES)
+        
+    finally:
+        session.close()
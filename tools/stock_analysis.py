@@ -5,16 +5,21 @@ This module contains tools for analyzing stock levels, ruptures,
 and slow-moving inventory.
 """
 
+import heapq
 from datetime import datetime, timedelta
 from decimal import Decimal
-from typing import List, Dict, Any
-from sqlalchemy import func, and_
+from typing import List, Dict, Any, Optional
+import numpy as np
+from sqlalchemy import Float, func, and_, or_, cast
 from sqlalchemy.orm import Session
 
 from database.connection import SessionLocal
-from database.schema import Product, SaleOrder, SaleOrderItem, StockMovement
+from database.rollups import ensure_rollups_fresh
+from database.schema import Product, SaleOrder, SaleOrderItem, StockMovement, DailyProductSales
+from tools._cache import ttl_lru_cache
 
 
+@ttl_lru_cache(shared=True)
 def detect_stock_rupture(days_lookback: int = 14) -> List[Dict[str, Any]]:
     """
     Detect products that are out of stock but had recent sales.
@@ -43,70 +48,71 @@ def detect_stock_rupture(days_lookback: int = 14) -> List[Dict[str, Any]]:
         >>> results = detect_stock_rupture(days_lookback=14)
         >>> print(f"Found {len(results)} products in rupture")
     """
+    ensure_rollups_fresh()
     session = SessionLocal()
     
     try:
-        cutoff_date = datetime.now() - timedelta(days=days_lookback)
+        now = datetime.now()
+        cutoff_date = now - timedelta(days=days_lookback)
         
-        # Query products with no stock but recent sales
+        # Query products with no stock but recent sales (from the daily rollup;
+        # an order has a single sale date, so daily order counts add up)
         query = session.query(
             Product.id,
             Product.sku,
             Product.name,
             Product.category,
-            Product.current_stock,
-            Product.sale_price,
-            func.count(func.distinct(SaleOrder.id)).label('sales_count'),
-            func.max(SaleOrder.sale_date).label('last_sale_date'),
-            func.sum(SaleOrderItem.quantity).label('total_quantity_sold')
-        ).join(
-            SaleOrderItem, Product.id == SaleOrderItem.product_id
+            cast(Product.current_stock, Float).label('current_stock'),
+            cast(Product.sale_price, Float).label('sale_price'),
+            func.sum(DailyProductSales.order_count).label('sales_count'),
+            func.max(DailyProductSales.sale_date).label('last_sale_date'),
+            func.sum(DailyProductSales.quantity).label('total_quantity_sold')
         ).join(
-            SaleOrder, SaleOrderItem.sale_order_id == SaleOrder.id
+            DailyProductSales, Product.id == DailyProductSales.product_id
         ).filter(
             and_(
                 Product.current_stock <= 0,
-                SaleOrder.sale_date >= cutoff_date.date(),
-                SaleOrder.status == 'PAID'
+                DailyProductSales.sale_date >= cutoff_date.date()
             )
         ).group_by(
-            Product.id,
-            Product.sku,
-            Product.name,
-            Product.category,
-            Product.current_stock,
-            Product.sale_price
+            Product.id
         ).order_by(
-            func.sum(SaleOrderItem.quantity).desc()
+            func.sum(DailyProductSales.quantity).desc(), Product.id
         ).all()
         
+        # Last movement that emptied the stock of each ruptured product
+        last_outbound_dates = dict(session.query(
+            StockMovement.product_id,
+            func.max(StockMovement.movement_date)
+        ).filter(
+            and_(
+                StockMovement.product_id.in_([row.id for row in query]),
+                StockMovement.stock_after == 0
+            )
+        ).group_by(StockMovement.product_id).all())
+        
+        # Demand and days out of stock (from last stock movement to now) of all products
+        total_sold = np.fromiter((row.total_quantity_sold or 0 for row in query), dtype=np.float64, count=len(query))
+        sale_price = np.fromiter((row.sale_price for row in query), dtype=np.float64, count=len(query))
+        days_out = np.fromiter(
+            ((now - last_outbound_dates[row.id]).days if last_outbound_dates.get(row.id) else 0 for row in query),
+            dtype=np.int64, count=len(query)
+        )
+        daily_demand = total_sold / days_lookback
+        
+        # Estimate lost revenue (days out * daily demand * price)
+        lost_revenue = days_out * daily_demand * sale_price
+        
         results = []
-        for row in query:
-            # Calculate metrics
-            total_sold = float(row.total_quantity_sold or 0)
-            daily_demand = total_sold / days_lookback
-            
-            # Estimate days out of stock (from last stock movement to now)
-            last_outbound = session.query(StockMovement).filter(
-                and_(
-                    StockMovement.product_id == row.id,
-                    StockMovement.stock_after == 0
-                )
-            ).order_by(StockMovement.movement_date.desc()).first()
-            
-            days_out = 0
-            if last_outbound:
-                days_out = (datetime.now() - last_outbound.movement_date).days
-            
-            # Estimate lost revenue (days out * daily demand * price)
-            lost_revenue = days_out * daily_demand * float(row.sale_price)
-            
+        for row, total_sold, daily_demand, days_out, lost_revenue in zip(
+            query, total_sold.tolist(), daily_demand.tolist(), days_out.tolist(), lost_revenue.tolist()
+        ):
             results.append({
                 'product_id': row.id,
                 'sku': row.sku,
                 'name': row.name,
                 'category': row.category or 'N/A',
-                'current_stock': float(row.current_stock),
+                'current_stock': row.current_stock,
                 'recent_sales_count': row.sales_count,
                 'last_sale_date': row.last_sale_date.isoformat() if row.last_sale_date else None,
                 'total_quantity_sold': total_sold,
@@ -121,7 +127,11 @@ def detect_stock_rupture(days_lookback: int = 14) -> List[Dict[str, Any]]:
         session.close()
 
 
-def analyze_slow_moving_stock(days_threshold: int = 30) -> List[Dict[str, Any]]:
+@ttl_lru_cache(shared=True)
+def analyze_slow_moving_stock(
+    days_threshold: int = 30,
+    limit: Optional[int] = None
+) -> List[Dict[str, Any]]:
     """
     Identify products with stock that haven't sold in a long time.
     
@@ -130,6 +140,7 @@ def analyze_slow_moving_stock(days_threshold: int = 30) -> List[Dict[str, Any]]:
     
     Args:
         days_threshold: Minimum days without sales to be considered slow-moving (default: 30)
+        limit: Return only the N products with the highest stock value (default: all)
     
     Returns:
         List of dictionaries containing:
@@ -152,47 +163,65 @@ def analyze_slow_moving_stock(days_threshold: int = 30) -> List[Dict[str, Any]]:
     session = SessionLocal()
     
     try:
-        cutoff_date = datetime.now() - timedelta(days=days_threshold)
+        now = datetime.now()
+        today_date = now.date()
+        cutoff_date = now - timedelta(days=days_threshold)
         
-        # Get all products with stock
-        products_with_stock = session.query(Product).filter(
-            Product.current_stock > 0
-        ).all()
+        # Last paid sale of every product
+        last_sales = session.query(
+            SaleOrderItem.product_id,
+            func.max(SaleOrder.sale_date).label('last_sale_date')
+        ).join(
+            SaleOrder, SaleOrder.id == SaleOrderItem.sale_order_id
+        ).filter(
+            SaleOrder.status == 'PAID'
+        ).group_by(SaleOrderItem.product_id).subquery()
         
-        results = []
-        for product in products_with_stock:
-            # Find last sale
-            last_sale = session.query(SaleOrder.sale_date).join(
-                SaleOrderItem, SaleOrder.id == SaleOrderItem.sale_order_id
-            ).filter(
-                and_(
-                    SaleOrderItem.product_id == product.id,
-                    SaleOrder.status == 'PAID'
+        # Products with stock and no sale since the cutoff (or never sold)
+        candidates = session.query(
+            Product.id,
+            Product.sku,
+            Product.name,
+            Product.category,
+            Product.current_stock,
+            Product.cost_price,
+            last_sales.c.last_sale_date
+        ).outerjoin(
+            last_sales, Product.id == last_sales.c.product_id
+        ).filter(
+            and_(
+                Product.current_stock > 0,
+                or_(
+                    last_sales.c.last_sale_date.is_(None),
+                    last_sales.c.last_sale_date <= cutoff_date.date()
                 )
-            ).order_by(SaleOrder.sale_date.desc()).first()
-            
-            last_sale_date = last_sale[0] if last_sale else None
+            )
+        ).order_by(Product.id).all()
+        product_ids = [product.id for product in candidates]
+        
+        # Last purchase of every candidate, in one query
+        last_purchases = dict(session.query(
+            StockMovement.product_id,
+            func.max(StockMovement.movement_date)
+        ).filter(
+            and_(
+                StockMovement.product_id.in_(product_ids),
+                StockMovement.movement_type == 'PURCHASE'
+            )
+        ).group_by(StockMovement.product_id).all())
+        
+        results = []
+        for product in candidates:
+            last_sale_date = product.last_sale_date
             
             # Calculate days without sale
             if last_sale_date:
-                days_without_sale = (datetime.now().date() - last_sale_date).days
+                days_without_sale = (today_date - last_sale_date).days
             else:
                 # Never sold - use a large number
                 days_without_sale = 9999
             
-            # Only include if exceeds threshold
-            if days_without_sale < days_threshold:
-                continue
-            
-            # Find last purchase
-            last_purchase = session.query(StockMovement.movement_date).filter(
-                and_(
-                    StockMovement.product_id == product.id,
-                    StockMovement.movement_type == 'PURCHASE'
-                )
-            ).order_by(StockMovement.movement_date.desc()).first()
-            
-            last_purchase_date = last_purchase[0] if last_purchase else None
+            last_purchase_date = last_purchases.get(product.id)
             
             # Calculate stock value
             stock_value = float(product.current_stock * product.cost_price)
@@ -219,8 +248,10 @@ def analyze_slow_moving_stock(days_threshold: int = 30) -> List[Dict[str, Any]]:
             })
         
         # Sort by stock value (highest first)
-        results.sort(key=lambda x: x['stock_value'], reverse=True)
+        if limit is not None:
+            return heapq.nlargest(limit, results, key=lambda x: x['stock_value'])
         
+        results.sort(key=lambda x: x['stock_value'], reverse=True)
         return results
         
     finally:
@@ -6,19 +6,27 @@ and analyzing whether products have sufficient purchase orders
 to cover future demand.
 """
 
+from collections import defaultdict
 from datetime import datetime, timedelta
 from decimal import Decimal
 from typing import List, Dict, Any, Optional
-from sqlalchemy import func, and_, or_
-from sqlalchemy.orm import Session
+import numpy as np
+from sqlalchemy import Float, func, and_, or_, cast, select
+from sqlalchemy.orm import Session, contains_eager, joinedload, selectinload
 
 from database.connection import SessionLocal
+from database.rollups import ensure_rollups_fresh
 from database.schema import (
     Product, PurchaseOrder, PurchaseOrderItem,
-    SaleOrder, SaleOrderItem
+    DailyProductSales
 )
+from tools._cache import ttl_lru_cache
 
+# Sort rank of each risk level (most urgent first)
+_RISK_ORDER = {'CRITICAL': 0, 'HIGH': 1, 'MEDIUM': 2, 'LOW': 3}
 
+
+@ttl_lru_cache(shared=True)
 def detect_imminent_stockout_risk(
     days_forecast: int = 30,
     days_history: int = 90,
@@ -77,76 +85,111 @@ def detect_imminent_stockout_risk(
         >>>     if not item['pending_orders']['is_sufficient']:
         >>>         print(f"  ⚠️ Need to order {item['gap_quantity']} more units!")
     """
+    ensure_rollups_fresh()
     session = SessionLocal()
     
     try:
-        cutoff_date = datetime.now() - timedelta(days=days_history)
+        now = datetime.now()
+        today_date = now.date()
+        cutoff_date = now - timedelta(days=days_history)
+        
+        # Paid sales in history period, per product (from the daily rollup)
+        sales_agg = select(
+            DailyProductSales.product_id,
+            func.sum(DailyProductSales.quantity).label('total_sold')
+        ).where(
+            DailyProductSales.sale_date >= cutoff_date.date()
+        ).group_by(DailyProductSales.product_id).cte('sales_agg')
+        
+        # Pending quantity and oldest pending order date, per product
+        pending_agg = select(
+            PurchaseOrderItem.product_id,
+            cast(func.sum(PurchaseOrderItem.quantity), Float).label('pending_quantity'),
+            func.min(PurchaseOrder.order_date).label('oldest_order_date')
+        ).join(
+            PurchaseOrder, PurchaseOrder.id == PurchaseOrderItem.purchase_order_id
+        ).where(
+            PurchaseOrder.status == 'PENDING'
+        ).group_by(PurchaseOrderItem.product_id).cte('pending_agg')
         
-        # Get all active products with stock > 0
-        products = session.query(Product).filter(
+        # Active products with stock and sales history, with their
+        # aggregates, in one query (amounts as floats)
+        products = session.query(
+            Product.id,
+            Product.sku,
+            Product.name,
+            Product.category,
+            cast(Product.current_stock, Float).label('current_stock'),
+            cast(Product.sale_price, Float).label('sale_price'),
+            cast(Product.cost_price, Float).label('cost_price'),
+            sales_agg.c.total_sold,
+            pending_agg.c.pending_quantity,
+            pending_agg.c.oldest_order_date
+        ).join(
+            sales_agg, sales_agg.c.product_id == Product.id
+        ).outerjoin(
+            pending_agg, pending_agg.c.product_id == Product.id
+        ).filter(
             and_(
                 Product.is_active == True,
                 Product.current_stock > 0
             )
-        ).all()
+        ).order_by(Product.id).all()
+        
+        # Sales velocity metrics of all products at once
+        count = len(products)
+        total_sold = np.fromiter((p.total_sold for p in products), dtype=np.float64, count=count)
+        current_stock = np.fromiter((p.current_stock for p in products), dtype=np.float64, count=count)
+        sale_price = np.fromiter((p.sale_price for p in products), dtype=np.float64, count=count)
+        
+        avg_daily_sales = total_sold / days_history
+        days_until_stockout = np.divide(
+            current_stock, avg_daily_sales, out=np.full(count, np.inf), where=avg_daily_sales > 0
+        )
+        forecasted_demand = avg_daily_sales * days_forecast
+        
+        # Losses start when stock runs out (if no pending orders arrive)
+        potential_lost_revenue = avg_daily_sales * sale_price * np.maximum(0, days_forecast - days_until_stockout)
+        
+        # Products that will run out soon (no sales history means no risk)
+        keep = np.flatnonzero((avg_daily_sales > 0) & (days_until_stockout <= min_days_threshold))
+        candidates = list(zip(
+            [products[i] for i in keep.tolist()],
+            current_stock[keep].tolist(),
+            avg_daily_sales[keep].tolist(),
+            days_until_stockout[keep].tolist(),
+            forecasted_demand[keep].tolist(),
+            potential_lost_revenue[keep].tolist()
+        ))
+        
+        # Pending purchase order details of candidates that have any, in one query
+        pending_by_product = defaultdict(list)
+        for po in session.query(
+            PurchaseOrderItem.product_id,
+            PurchaseOrder.id,
+            PurchaseOrder.order_number,
+            PurchaseOrder.order_date,
+            cast(PurchaseOrderItem.quantity, Float).label('quantity'),
+            cast(PurchaseOrderItem.unit_price, Float).label('unit_price')
+        ).join(
+            PurchaseOrderItem, PurchaseOrder.id == PurchaseOrderItem.purchase_order_id
+        ).filter(
+            and_(
+                PurchaseOrderItem.product_id.in_(
+                    [c[0].id for c in candidates if c[0].pending_quantity is not None]
+                ),
+                PurchaseOrder.status == 'PENDING'
+            )
+        ).all():
+            pending_by_product[po.product_id].append(po)
         
         at_risk_products = []
+        sort_keys = []  # (risk rank, days until stockout) per product
         
-        for product in products:
-            # Calculate sales in history period
-            sales_data = session.query(
-                func.sum(SaleOrderItem.quantity).label('total_sold'),
-                func.count(func.distinct(SaleOrder.id)).label('sales_count'),
-                func.max(SaleOrder.sale_date).label('last_sale')
-            ).join(
-                SaleOrder, SaleOrderItem.sale_order_id == SaleOrder.id
-            ).filter(
-                and_(
-                    SaleOrderItem.product_id == product.id,
-                    SaleOrder.sale_date >= cutoff_date.date(),
-                    SaleOrder.status == 'PAID'
-                )
-            ).first()
-            
-            total_sold = float(sales_data.total_sold or 0)
-            
-            # Skip products with no sales history
-            if total_sold == 0:
-                continue
-            
-            # Calculate average daily sales
-            avg_daily_sales = total_sold / days_history
-            
-            # Calculate days until stockout
-            current_stock = float(product.current_stock)
-            
-            if avg_daily_sales > 0:
-                days_until_stockout = current_stock / avg_daily_sales
-            else:
-                continue  # No demand, no risk
-            
-            # Only include products that will run out soon
-            if days_until_stockout > min_days_threshold:
-                continue
-            
-            # Forecast demand for the forecast period
-            forecasted_demand = avg_daily_sales * days_forecast
-            
+        for (product, current_stock, avg_daily_sales, days_until_stockout,
+                forecasted_demand, potential_lost_revenue) in candidates:
             # === CHECK PENDING PURCHASE ORDERS ===
-            pending_orders_query = session.query(
-                PurchaseOrder.id,
-                PurchaseOrder.order_number,
-                PurchaseOrder.order_date,
-                PurchaseOrderItem.quantity,
-                PurchaseOrderItem.unit_price
-            ).join(
-                PurchaseOrderItem, PurchaseOrder.id == PurchaseOrderItem.purchase_order_id
-            ).filter(
-                and_(
-                    PurchaseOrderItem.product_id == product.id,
-                    PurchaseOrder.status == 'PENDING'
-                )
-            ).all()
+            pending_orders_query = pending_by_product.get(product.id, [])
             
             # Process pending orders
             pending_orders_info = {
@@ -160,27 +203,19 @@ def detect_imminent_stockout_risk(
             
             if pending_orders_query:
                 pending_orders_info['count'] = len(pending_orders_query)
+                pending_orders_info['total_quantity'] = product.pending_quantity
                 
-                oldest_order_date = None
-                for po in pending_orders_query:
-                    qty = float(po.quantity)
-                    pending_orders_info['total_quantity'] += qty
-                    
-                    pending_orders_info['orders'].append({
-                        'order_id': po.id,
-                        'order_number': po.order_number,
-                        'order_date': po.order_date.isoformat(),
-                        'quantity': qty,
-                        'unit_price': float(po.unit_price)
-                    })
-                    
-                    if oldest_order_date is None or po.order_date < oldest_order_date:
-                        oldest_order_date = po.order_date
+                pending_orders_info['orders'] = [{
+                    'order_id': po.id,
+                    'order_number': po.order_number,
+                    'order_date': po.order_date.isoformat(),
+                    'quantity': po.quantity,
+                    'unit_price': po.unit_price
+                } for po in pending_orders_query]
                 
                 # Calculate age of oldest order
-                if oldest_order_date:
-                    pending_orders_info['oldest_order_days'] = (datetime.now().date() - oldest_order_date).days
-                    pending_orders_info['is_delayed'] = pending_orders_info['oldest_order_days'] > 7
+                pending_orders_info['oldest_order_days'] = (today_date - product.oldest_order_date).days
+                pending_orders_info['is_delayed'] = pending_orders_info['oldest_order_days'] > 7
                 
                 # Check if pending orders are sufficient
                 total_needed = forecasted_demand - current_stock
@@ -210,12 +245,9 @@ def detect_imminent_stockout_risk(
             else:
                 recommendation = "MONITOR: Pending orders should cover demand"
             
-            # Calculate potential lost revenue
-            daily_revenue = avg_daily_sales * float(product.sale_price)
-            # If no pending orders, losses start when stock runs out
-            days_of_potential_loss = max(0, days_forecast - days_until_stockout)
-            potential_lost_revenue = daily_revenue * days_of_potential_loss
+            days_until_stockout = round(days_until_stockout, 1)
             
+            sort_keys.append((_RISK_ORDER[risk_level], days_until_stockout))
             at_risk_products.append({
                 'product_id': product.id,
                 'sku': product.sku,
@@ -223,22 +255,20 @@ def detect_imminent_stockout_risk(
                 'category': product.category or 'N/A',
                 'current_stock': round(current_stock, 2),
                 'avg_daily_sales': round(avg_daily_sales, 2),
-                'days_until_stockout': round(days_until_stockout, 1),
+                'days_until_stockout': days_until_stockout,
                 'forecasted_demand': round(forecasted_demand, 2),
                 'pending_orders': pending_orders_info,
                 'gap_quantity': round(gap_quantity, 2),
                 'risk_level': risk_level,
                 'recommendation': recommendation,
                 'potential_lost_revenue': round(potential_lost_revenue, 2),
-                'unit_sale_price': float(product.sale_price),
-                'unit_cost': float(product.cost_price)
+                'unit_sale_price': product.sale_price,
+                'unit_cost': product.cost_price
             })
         
-        # Sort by risk level then by days until stockout
-        risk_order = {'CRITICAL': 0, 'HIGH': 1, 'MEDIUM': 2, 'LOW': 3}
-        at_risk_products.sort(key=lambda x: (risk_order[x['risk_level']], x['days_until_stockout']))
-        
-        return at_risk_products
+        # Sort by risk level then by days until stockout (keys precomputed, stable for ties)
+        order = sorted(range(len(at_risk_products)), key=sort_keys.__getitem__)
+        return [at_risk_products[i] for i in order]
         
     finally:
         session.close()
@@ -273,23 +303,36 @@ def get_pending_order_summary(product_id: Optional[int] = None) -> List[Dict[str
     session = SessionLocal()
     
     try:
-        query = session.query(PurchaseOrder).filter(
+        today_date = datetime.now().date()
+        
+        # Load suppliers, items and their products up front (no lazy loads in the loop)
+        query = session.query(PurchaseOrder).options(
+            joinedload(PurchaseOrder.supplier)
+        ).filter(
             PurchaseOrder.status == 'PENDING'
         )
         
+        if product_id is None:
+            query = query.options(
+                selectinload(PurchaseOrder.items).joinedload(PurchaseOrderItem.product)
+            )
+        else:
+            # Only orders containing the product, loaded with only its items
+            query = query.join(PurchaseOrder.items).filter(
+                PurchaseOrderItem.product_id == product_id
+            ).options(
+                contains_eager(PurchaseOrder.items).joinedload(PurchaseOrderItem.product)
+            )
+        
         pending_orders = query.all()
         
         result = []
         for po in pending_orders:
-            days_pending = (datetime.now().date() - po.order_date).days
+            days_pending = (today_date - po.order_date).days
             
             # Get items in this order
             items = []
             for item in po.items:
-                # Filter by product_id if specified
-                if product_id is not None and item.product_id != product_id:
-                    continue
-                
                 items.append({
                     'product_id': item.product_id,
                     'product_name': item.product.name,
@@ -299,10 +342,6 @@ def get_pending_order_summary(product_id: Optional[int] = None) -> List[Dict[str
                     'subtotal': float(item.quantity * item.unit_price)
                 })
             
-            # Skip if filtering by product and no matching items
-            if product_id is not None and not items:
-                continue
-            
             result.append({
                 'purchase_order_id': po.id,
                 'order_number': po.order_number,
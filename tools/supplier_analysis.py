@@ -5,22 +5,29 @@ This module contains tools for analyzing supplier performance
 based on product turnover and sales metrics.
 """
 
+import heapq
 from datetime import datetime, timedelta
 from decimal import Decimal
-from typing import List, Dict, Any
-from sqlalchemy import func, and_, or_
+from operator import itemgetter
+from typing import List, Dict, Any, Optional
+import numpy as np
+from sqlalchemy import func, or_, case
 from sqlalchemy.orm import Session
 
 from database.connection import SessionLocal
+from database.rollups import ensure_rollups_fresh
 from database.schema import (
     Product, Supplier, PurchaseOrder, PurchaseOrderItem,
-    SaleOrder, SaleOrderItem, StockMovement
+    StockMovement, DailyProductSales
 )
+from tools._cache import ttl_lru_cache
 
 
+@ttl_lru_cache(shared=True)
 def analyze_supplier_performance(
     metric: str = 'turnover_rate',
-    days_period: int = 90
+    days_period: int = 90,
+    limit: Optional[int] = None
 ) -> List[Dict[str, Any]]:
     """
     Analyze supplier performance based on product sales metrics.
@@ -34,6 +41,7 @@ def analyze_supplier_performance(
             - 'revenue': Total revenue generated
             - 'slow_moving': Percentage of slow-moving products (lower is better)
         days_period: Period to analyze in days (default: 90)
+        limit: Maximum number of suppliers to return (default: all)
     
     Returns:
         List of dictionaries containing:
@@ -55,60 +63,86 @@ def analyze_supplier_performance(
         >>> best = results[0]
         >>> print(f"Best supplier: {best['supplier_name']} (score: {best['performance_score']})")
     """
+    ensure_rollups_fresh()
     session = SessionLocal()
     
     try:
-        cutoff_date = datetime.now() - timedelta(days=days_period)
+        now = datetime.now()
+        cutoff_date = (now - timedelta(days=days_period)).date()
         slow_threshold = 30  # Days without sale = slow-moving
+        recent_cutoff = (now - timedelta(days=slow_threshold)).date()
         
         suppliers = session.query(Supplier).filter(Supplier.is_active == True).all()
+        
+        # Products ever purchased from each supplier
+        supplier_products = session.query(
+            PurchaseOrder.supplier_id,
+            Product.id,
+            Product.current_stock
+        ).join(
+            PurchaseOrderItem, Product.id == PurchaseOrderItem.product_id
+        ).join(
+            PurchaseOrder, PurchaseOrderItem.purchase_order_id == PurchaseOrder.id
+        ).distinct().all()
+        
+        products_by_supplier = {}
+        for row in supplier_products:
+            products_by_supplier.setdefault(row.supplier_id, []).append(row)
+        
+        # Total purchased from each supplier in the period
+        purchased_by_supplier = dict(session.query(
+            PurchaseOrder.supplier_id,
+            func.sum(PurchaseOrderItem.quantity * PurchaseOrderItem.unit_price)
+        ).join(
+            PurchaseOrder, PurchaseOrderItem.purchase_order_id == PurchaseOrder.id
+        ).filter(
+            PurchaseOrder.order_date >= cutoff_date
+        ).group_by(PurchaseOrder.supplier_id).all())
+        
+        # Total revenue from each supplier's products in the period
+        # (paid sales come from the daily rollup)
+        supplier_product_ids = session.query(
+            PurchaseOrder.supplier_id,
+            PurchaseOrderItem.product_id
+        ).join(
+            PurchaseOrder, PurchaseOrderItem.purchase_order_id == PurchaseOrder.id
+        ).distinct().subquery()
+        
+        revenue_by_supplier = dict(session.query(
+            supplier_product_ids.c.supplier_id,
+            func.sum(DailyProductSales.revenue)
+        ).join(
+            DailyProductSales, DailyProductSales.product_id == supplier_product_ids.c.product_id
+        ).filter(
+            DailyProductSales.sale_date >= cutoff_date
+        ).group_by(supplier_product_ids.c.supplier_id).all())
+        
+        # Quantity sold in the period and last sale, per product
+        sales_by_product = {
+            row.product_id: row for row in session.query(
+                DailyProductSales.product_id,
+                func.sum(case(
+                    (DailyProductSales.sale_date >= cutoff_date, DailyProductSales.quantity), else_=0
+                )).label('qty_sold'),
+                func.max(DailyProductSales.sale_date).label('last_sale')
+            ).filter(
+                DailyProductSales.sale_date >= min(cutoff_date, recent_cutoff)
+            ).group_by(DailyProductSales.product_id).all()
+        }
+        
         results = []
+        avg_turnover_list = []
+        revenue_list = []
+        slow_moving_pct_list = []
         
         for supplier in suppliers:
-            # Get all products purchased from this supplier
-            purchased_products = session.query(
-                Product.id,
-                Product.name,
-                Product.current_stock,
-                Product.cost_price,
-                Product.sale_price
-            ).join(
-                PurchaseOrderItem, Product.id == PurchaseOrderItem.product_id
-            ).join(
-                PurchaseOrder, PurchaseOrderItem.purchase_order_id == PurchaseOrder.id
-            ).filter(
-                PurchaseOrder.supplier_id == supplier.id
-            ).distinct().all()
+            purchased_products = products_by_supplier.get(supplier.id)
             
             if not purchased_products:
                 continue
             
-            product_ids = [p.id for p in purchased_products]
-            
-            # Calculate total purchased from supplier
-            total_purchased = session.query(
-                func.sum(PurchaseOrderItem.quantity * PurchaseOrderItem.unit_price)
-            ).join(
-                PurchaseOrder, PurchaseOrderItem.purchase_order_id == PurchaseOrder.id
-            ).filter(
-                and_(
-                    PurchaseOrder.supplier_id == supplier.id,
-                    PurchaseOrder.order_date >= cutoff_date.date()
-                )
-            ).scalar() or Decimal('0')
-            
-            # Calculate total revenue from supplier's products
-            total_revenue = session.query(
-                func.sum(SaleOrderItem.quantity * SaleOrderItem.unit_price)
-            ).join(
-                SaleOrder, SaleOrderItem.sale_order_id == SaleOrder.id
-            ).filter(
-                and_(
-                    SaleOrderItem.product_id.in_(product_ids),
-                    SaleOrder.sale_date >= cutoff_date.date(),
-                    SaleOrder.status == 'PAID'
-                )
-            ).scalar() or Decimal('0')
+            total_purchased = purchased_by_supplier.get(supplier.id) or Decimal('0')
+            total_revenue = revenue_by_supplier.get(supplier.id) or Decimal('0')
             
             # Calculate turnover metrics for each product
             turnover_rates = []
@@ -119,43 +153,16 @@ def analyze_supplier_performance(
                 if product.current_stock > 0:
                     products_in_stock += 1
                 
-                # Get sales count in period
-                sales_count = session.query(func.count(SaleOrderItem.id)).join(
-                    SaleOrder, SaleOrderItem.sale_order_id == SaleOrder.id
-                ).filter(
-                    and_(
-                        SaleOrderItem.product_id == product.id,
-                        SaleOrder.sale_date >= cutoff_date.date(),
-                        SaleOrder.status == 'PAID'
-                    )
-                ).scalar() or 0
-                
-                # Get quantity sold in period
-                qty_sold = session.query(func.sum(SaleOrderItem.quantity)).join(
-                    SaleOrder, SaleOrderItem.sale_order_id == SaleOrder.id
-                ).filter(
-                    and_(
-                        SaleOrderItem.product_id == product.id,
-                        SaleOrder.sale_date >= cutoff_date.date(),
-                        SaleOrder.status == 'PAID'
-                    )
-                ).scalar() or 0
+                sales = sales_by_product.get(product.id)
                 
                 # Check if slow-moving (no sales in last 30 days)
-                recent_sales = session.query(func.count(SaleOrderItem.id)).join(
-                    SaleOrder, SaleOrderItem.sale_order_id == SaleOrder.id
-                ).filter(
-                    and_(
-                        SaleOrderItem.product_id == product.id,
-                        SaleOrder.sale_date >= (datetime.now() - timedelta(days=slow_threshold)).date(),
-                        SaleOrder.status == 'PAID'
-                    )
-                ).scalar() or 0
+                last_sale = sales.last_sale if sales else None
                 
-                if recent_sales == 0 and product.current_stock > 0:
+                if (last_sale is None or last_sale < recent_cutoff) and product.current_stock > 0:
                     slow_moving_count += 1
                 
                 # Calculate turnover rate (sales per day)
+                qty_sold = (sales.qty_sold if sales else 0) or 0
                 if qty_sold > 0:
                     turnover_rate = float(qty_sold) / days_period
                     turnover_rates.append(turnover_rate)
@@ -164,23 +171,9 @@ def analyze_supplier_performance(
             avg_turnover = sum(turnover_rates) / len(turnover_rates) if turnover_rates else 0
             slow_moving_pct = (slow_moving_count / len(purchased_products) * 100) if purchased_products else 0
             
-            # Calculate performance score (0-100)
-            # Based on: turnover rate (50%), revenue (30%), low slow-moving % (20%)
-            turnover_score = min(avg_turnover * 10, 50)  # Max 50 points
-            revenue_score = min(float(total_revenue) / 10000 * 30, 30)  # Max 30 points
-            slow_moving_score = max(20 - (slow_moving_pct / 5), 0)  # Max 20 points, penalize slow-moving
-            
-            performance_score = turnover_score + revenue_score + slow_moving_score
-            
-            # Rating
-            if performance_score >= 75:
-                rating = "Excellent"
-            elif performance_score >= 60:
-                rating = "Good"
-            elif performance_score >= 40:
-                rating = "Fair"
-            else:
-                rating = "Poor"
+            avg_turnover_list.append(avg_turnover)
+            revenue_list.append(float(total_revenue))
+            slow_moving_pct_list.append(slow_moving_pct)
             
             results.append({
                 'supplier_id': supplier.id,
@@ -188,25 +181,52 @@ def analyze_supplier_performance(
                 'tax_id': supplier.tax_id,
                 'products_supplied': len(purchased_products),
                 'total_purchased': float(total_purchased),
-                'total_revenue': float(total_revenue),
+                'total_revenue': round(float(total_revenue), 2),
                 'avg_turnover_rate': round(avg_turnover, 3),
                 'products_in_stock': products_in_stock,
                 'slow_moving_products': slow_moving_count,
-                'slow_moving_percentage': round(slow_moving_pct, 1),
-                'performance_score': round(performance_score, 1),
-                'rating': rating
+                'slow_moving_percentage': round(slow_moving_pct, 1)
             })
         
+        # Calculate performance scores (0-100) of all suppliers at once
+        # Based on: turnover rate (50%), revenue (30%), low slow-moving % (20%)
+        turnover_score = np.minimum(np.array(avg_turnover_list, dtype=float) * 10, 50)  # Max 50 points
+        revenue_score = np.minimum(np.array(revenue_list, dtype=float) / 10000 * 30, 30)  # Max 30 points
+        slow_moving_score = np.maximum(20 - np.array(slow_moving_pct_list, dtype=float) / 5, 0)  # Max 20 points, penalize slow-moving
+        
+        performance_scores = turnover_score + revenue_score + slow_moving_score
+        
+        # Rating
+        ratings = np.select(
+            [performance_scores >= 75, performance_scores >= 60, performance_scores >= 40],
+            ['Excellent', 'Good', 'Fair'],
+            default='Poor'
+        )
+        
+        for result, score, rating in zip(results, performance_scores.tolist(), ratings.tolist()):
+            result['performance_score'] = round(score, 1)
+            result['rating'] = rating
+        
         # Sort by selected metric
+        descending = True
         if metric == 'turnover_rate':
-            results.sort(key=lambda x: x['avg_turnover_rate'], reverse=True)
+            sort_key = itemgetter('avg_turnover_rate')
         elif metric == 'revenue':
-            results.sort(key=lambda x: x['total_revenue'], reverse=True)
+            sort_key = itemgetter('total_revenue')
         elif metric == 'slow_moving':
-            results.sort(key=lambda x: x['slow_moving_percentage'])
+            sort_key = itemgetter('slow_moving_percentage')
+            descending = False
         else:
             # Default: by performance score
-            results.sort(key=lambda x: x['performance_score'], reverse=True)
+            sort_key = itemgetter('performance_score')
+        
+        # Only the top suppliers need ordering when a limit is given
+        if limit is None:
+            results.sort(key=sort_key, reverse=descending)
+        elif descending:
+            results = heapq.nlargest(limit, results, key=sort_key)
+        else:
+            results = heapq.nsmallest(limit, results, key=sort_key)
         
         return results
         
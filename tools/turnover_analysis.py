@@ -5,9 +5,12 @@ This module contains tools for analyzing the time between
 purchase and sale, helping identify slow-moving inventory.
 """
 
+import heapq
 from datetime import datetime, timedelta
 from decimal import Decimal
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Union
+import numpy as np
+import pandas as pd
 from sqlalchemy import func, and_
 from sqlalchemy.orm import Session
 
@@ -16,12 +19,28 @@ from database.schema import (
     Product, PurchaseOrder, PurchaseOrderItem,
     SaleOrder, SaleOrderItem, StockMovement
 )
+from tools._cache import ttl_lru_cache
 
+_TURNOVER_COLUMNS = [
+    'product_id', 'sku', 'name', 'category', 'purchases_count',
+    'avg_days_to_sale', 'min_days_to_sale', 'max_days_to_sale',
+    'still_unsold_count', 'current_stock', 'turnover_rating', 'recommendation'
+]
 
+_TURNOVER_RECOMMENDATIONS = {
+    'FAST': "Excellent turnover - maintain current inventory levels",
+    'MEDIUM': "Good turnover - monitor for optimization opportunities",
+    'SLOW': "Slow turnover - consider reducing order quantities or frequency"
+}
+
+
+@ttl_lru_cache(shared=True)
 def analyze_purchase_to_sale_time(
     days_period: int = 90,
-    min_purchases: int = 1
-) -> List[Dict[str, Any]]:
+    min_purchases: int = 1,
+    return_frame: bool = False,
+    limit: Optional[int] = None
+) -> Union[List[Dict[str, Any]], pd.DataFrame]:
     """
     Analyze time between purchase and first sale for products.
     
@@ -38,9 +57,13 @@ def analyze_purchase_to_sale_time(
     Args:
         days_period: Historical period to analyze in days (default: 90)
         min_purchases: Minimum purchases to include product (default: 1)
+        return_frame: Return a pandas DataFrame (one row per product)
+            instead of a list of dictionaries (default: False)
+        limit: Maximum number of products to return, slowest first
+            (default: all)
     
     Returns:
-        List of dictionaries containing:
+        List of dictionaries (or DataFrame columns) containing:
         - product_id: Product ID
         - sku: Product SKU
         - name: Product name
@@ -78,101 +101,118 @@ def analyze_purchase_to_sale_time(
         
         product_ids = [p.id for p in products_with_purchases]
         
+        # Load all candidate products at once
+        products_by_id = {
+            p.id: p for p in session.query(Product).filter(Product.id.in_(product_ids)).all()
+        }
+        
+        # Load paid sale dates of all candidate products at once
+        sale_rows = session.query(
+            SaleOrderItem.product_id,
+            SaleOrder.sale_date
+        ).join(
+            SaleOrder, SaleOrderItem.sale_order_id == SaleOrder.id
+        ).filter(
+            and_(
+                SaleOrderItem.product_id.in_(product_ids),
+                SaleOrder.status == 'PAID'
+            )
+        ).order_by(SaleOrder.sale_date).all()
+        
+        sales = pd.DataFrame(sale_rows, columns=['product_id', 'sale_date'])
+        
+        # Received purchases in the period of all candidate products at once
+        purchase_rows = session.query(
+            PurchaseOrderItem.product_id,
+            PurchaseOrder.received_date
+        ).join(
+            PurchaseOrderItem, PurchaseOrder.id == PurchaseOrderItem.purchase_order_id
+        ).filter(
+            and_(
+                PurchaseOrderItem.product_id.in_(product_ids),
+                PurchaseOrder.order_date >= cutoff_date.date(),
+                PurchaseOrder.status == 'RECEIVED',
+                PurchaseOrder.received_date.isnot(None)
+            )
+        ).order_by(PurchaseOrder.received_date).all()
+        
+        purchases = pd.DataFrame(purchase_rows, columns=['product_id', 'received_date'])
+        
+        # Match each purchase with the first sale on or after its receipt
+        purchases['received_date'] = pd.to_datetime(purchases['received_date'])
+        sales['sale_date'] = pd.to_datetime(sales['sale_date'])
+        purchases = pd.merge_asof(
+            purchases, sales,
+            left_on='received_date', right_on='sale_date',
+            by='product_id', direction='forward'
+        )
+        purchases['days_to_sale'] = (purchases['sale_date'] - purchases['received_date']).dt.days
+        
+        # Statistics per product (NaN days are purchases with no sale yet)
+        stats = purchases.groupby('product_id').agg(
+            purchases_count=('received_date', 'size'),
+            sold_count=('days_to_sale', 'count'),
+            avg_days=('days_to_sale', 'mean'),
+            min_days=('days_to_sale', 'min'),
+            max_days=('days_to_sale', 'max')
+        )
+        
+        # Skip products with too few purchases or no sales data
+        stats = stats[(stats['purchases_count'] >= min_purchases) & (stats['sold_count'] > 0)]
+        stats = stats.loc[pd.Index(product_ids).intersection(stats.index, sort=False)]
+        
         results = []
+        avg_days_list = stats['avg_days'].tolist()
         
-        for product_id in product_ids:
-            product = session.query(Product).filter(Product.id == product_id).first()
-            
-            if not product:
-                continue
-            
-            # Get all purchases for this product in the period
-            purchases = session.query(
-                PurchaseOrder.id,
-                PurchaseOrder.received_date,
-                PurchaseOrderItem.quantity
-            ).join(
-                PurchaseOrderItem, PurchaseOrder.id == PurchaseOrderItem.purchase_order_id
-            ).filter(
-                and_(
-                    PurchaseOrderItem.product_id == product_id,
-                    PurchaseOrder.order_date >= cutoff_date.date(),
-                    PurchaseOrder.status == 'RECEIVED',
-                    PurchaseOrder.received_date.isnot(None)
-                )
-            ).order_by(PurchaseOrder.received_date).all()
-            
-            if len(purchases) < min_purchases:
-                continue
-            
-            # For each purchase, find time to first sale
-            days_to_sale_list = []
-            unsold_count = 0
-            
-            for purchase in purchases:
-                purchase_date = purchase.received_date
-                
-                # Find first sale after this purchase
-                first_sale = session.query(SaleOrder.sale_date).join(
-                    SaleOrderItem, SaleOrder.id == SaleOrderItem.sale_order_id
-                ).filter(
-                    and_(
-                        SaleOrderItem.product_id == product_id,
-                        SaleOrder.sale_date >= purchase_date,
-                        SaleOrder.status == 'PAID'
-                    )
-                ).order_by(SaleOrder.sale_date).first()
-                
-                if first_sale:
-                    days_to_sale = (first_sale.sale_date - purchase_date).days
-                    days_to_sale_list.append(days_to_sale)
-                else:
-                    unsold_count += 1
-            
-            # Skip if no sales data
-            if not days_to_sale_list:
-                continue
-            
-            # Calculate statistics
-            avg_days = sum(days_to_sale_list) / len(days_to_sale_list)
-            min_days = min(days_to_sale_list)
-            max_days = max(days_to_sale_list)
-            
-            # Determine turnover rating
-            if avg_days <= 7:
-                turnover_rating = "FAST"
-                recommendation = "Excellent turnover - maintain current inventory levels"
-            elif avg_days <= 21:
-                turnover_rating = "MEDIUM"
-                recommendation = "Good turnover - monitor for optimization opportunities"
-            else:
-                turnover_rating = "SLOW"
-                recommendation = "Slow turnover - consider reducing order quantities or frequency"
+        for product_id, purchases_count, sold_count, avg_days, min_days, max_days in zip(
+            stats.index.tolist(),
+            stats['purchases_count'].tolist(),
+            stats['sold_count'].tolist(),
+            avg_days_list,
+            stats['min_days'].tolist(),
+            stats['max_days'].tolist()
+        ):
+            product = products_by_id[product_id]
             
             results.append({
                 'product_id': product.id,
                 'sku': product.sku,
                 'name': product.name,
                 'category': product.category or 'N/A',
-                'purchases_count': len(purchases),
+                'purchases_count': purchases_count,
                 'avg_days_to_sale': round(avg_days, 1),
-                'min_days_to_sale': min_days,
-                'max_days_to_sale': max_days,
-                'still_unsold_count': unsold_count,
-                'current_stock': float(product.current_stock),
-                'turnover_rating': turnover_rating,
-                'recommendation': recommendation
+                'min_days_to_sale': int(min_days),
+                'max_days_to_sale': int(max_days),
+                'still_unsold_count': purchases_count - sold_count,
+                'current_stock': float(product.current_stock)
             })
         
-        # Sort by avg days (slowest first)
-        results.sort(key=lambda x: x['avg_days_to_sale'], reverse=True)
+        # Determine turnover ratings for all products at once
+        avg_days_array = np.array(avg_days_list, dtype=float)
+        ratings = np.select(
+            [avg_days_array <= 7, avg_days_array <= 21],
+            ['FAST', 'MEDIUM'],
+            default='SLOW'
+        )
+        for result, rating in zip(results, ratings):
+            result['turnover_rating'] = str(rating)
+            result['recommendation'] = _TURNOVER_RECOMMENDATIONS[result['turnover_rating']]
+        
+        # Sort by avg days (slowest first), only the top ones given a limit
+        if limit is None:
+            results.sort(key=lambda x: x['avg_days_to_sale'], reverse=True)
+        else:
+            results = heapq.nlargest(limit, results, key=lambda x: x['avg_days_to_sale'])
         
+        if return_frame:
+            return pd.DataFrame(results, columns=_TURNOVER_COLUMNS)
         return results
         
     finally:
         session.close()
 
 
+@ttl_lru_cache(shared=True)
 def get_inventory_age_distribution() -> Dict[str, Any]:
     """
     Get distribution of inventory by age (time in stock).
@@ -200,6 +240,8 @@ def get_inventory_age_distribution() -> Dict[str, Any]:
     session = SessionLocal()
     
     try:
+        now = datetime.now()
+        
         # Define age brackets
         brackets = [
             {'name': '0-7 days', 'min': 0, 'max': 7},
@@ -209,76 +251,73 @@ def get_inventory_age_distribution() -> Dict[str, Any]:
             {'name': '60+ days', 'min': 61, 'max': 9999}
         ]
         
-        products_with_stock = session.query(Product).filter(
-            Product.current_stock > 0
-        ).all()
+        # Last purchase (stock entry) of every product in stock, in one query
+        products_with_stock = session.query(
+            Product.name,
+            Product.sku,
+            Product.current_stock,
+            Product.cost_price,
+            func.max(StockMovement.movement_date).label('last_purchase_date')
+        ).join(
+            StockMovement, Product.id == StockMovement.product_id
+        ).filter(
+            and_(
+                Product.current_stock > 0,
+                StockMovement.movement_type == 'PURCHASE'
+            )
+        ).group_by(Product.id).order_by(Product.id).all()
+        
+        # Calculate age and stock value of all products at once
+        ages = np.fromiter(
+            ((now - p.last_purchase_date).days for p in products_with_stock),
+            dtype=np.int64, count=len(products_with_stock)
+        )
+        stock_values = [float(p.current_stock * p.cost_price) for p in products_with_stock]
+        total_value = sum(stock_values)
         
-        # Calculate age for each product (last purchase date)
-        age_data = []
-        total_value = 0
-        ages_for_avg = []
+        # Oldest inventory (first product with the highest positive age)
         oldest_product = None
-        max_age = 0
+        if len(ages) and ages.max() > 0:
+            i = int(ages.argmax())
+            product = products_with_stock[i]
+            oldest_product = {
+                'name': product.name,
+                'sku': product.sku,
+                'age_days': int(ages[i]),
+                'stock': float(product.current_stock),
+                'value': stock_values[i]
+            }
         
-        for product in products_with_stock:
-            # Find last purchase (stock entry)
-            last_purchase = session.query(StockMovement.movement_date).filter(
-                and_(
-                    StockMovement.product_id == product.id,
-                    StockMovement.movement_type == 'PURCHASE'
-                )
-            ).order_by(StockMovement.movement_date.desc()).first()
-            
-            if not last_purchase:
-                continue
-            
-            age_days = (datetime.now() - last_purchase.movement_date).days
-            stock_value = float(product.current_stock * product.cost_price)
-            
-            age_data.append({
-                'product': product,
-                'age_days': age_days,
-                'stock_value': stock_value
-            })
-            
-            total_value += stock_value
-            ages_for_avg.append(age_days)
-            
-            if age_days > max_age:
-                max_age = age_days
-                oldest_product = {
-                    'name': product.name,
-                    'sku': product.sku,
-                    'age_days': age_days,
-                    'stock': float(product.current_stock),
-                    'value': stock_value
-                }
+        # Distribute into brackets (ages outside every bracket are left out)
+        bracket_edges = np.array([b['min'] for b in brackets] + [brackets[-1]['max'] + 1])
+        bracket_idx = np.digitize(ages, bracket_edges) - 1
+        in_range = (bracket_idx >= 0) & (bracket_idx < len(brackets))
+        
+        bracket_counts = np.bincount(bracket_idx[in_range], minlength=len(brackets))
+        bracket_values = np.bincount(
+            bracket_idx[in_range],
+            weights=np.array(stock_values, dtype=float)[in_range],
+            minlength=len(brackets)
+        )
         
-        # Distribute into brackets
         bracket_results = []
         
-        for bracket in brackets:
-            products_in_bracket = [
-                item for item in age_data
-                if bracket['min'] <= item['age_days'] <= bracket['max']
-            ]
-            
-            bracket_value = sum(item['stock_value'] for item in products_in_bracket)
+        for bracket, products_count, bracket_value in zip(brackets, bracket_counts.tolist(), bracket_values.tolist()):
             percentage = (bracket_value / total_value * 100) if total_value > 0 else 0
             
             bracket_results.append({
                 'bracket': bracket['name'],
-                'products_count': len(products_in_bracket),
+                'products_count': products_count,
                 'total_value': round(bracket_value, 2),
                 'percentage': round(percentage, 1)
             })
         
         # Calculate average age
-        avg_age = sum(ages_for_avg) / len(ages_for_avg) if ages_for_avg else 0
+        avg_age = int(ages.sum()) / len(ages) if len(ages) else 0
         
         return {
             'age_brackets': bracket_results,
-            'total_products': len(age_data),
+            'total_products': len(products_with_stock),
             'total_value': round(total_value, 2),
             'avg_age_days': round(avg_age, 1),
             'oldest_product': oldest_product
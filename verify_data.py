@@ -9,7 +9,7 @@ from database.connection import SessionLocal
 from database.schema import (
     Product, Supplier, PurchaseOrder, SaleOrder, StockMovement
 )
-from sqlalchemy import func
+from sqlalchemy import func, select
 
 def main():
     session = SessionLocal()
@@ -18,19 +18,24 @@ def main():
     print("🔍 DATABASE VERIFICATION")
     print("=" * 60)
     
-    # Count records
-    products_count = session.query(Product).count()
-    suppliers_count = session.query(Supplier).count()
-    purchases_count = session.query(PurchaseOrder).count()
-    sales_count = session.query(SaleOrder).count()
-    movements_count = session.query(StockMovement).count()
+    # Count records and stock statistics in a single query
+    stats = session.execute(select(
+        select(func.count(Product.id)).scalar_subquery().label('products'),
+        select(func.count(Supplier.id)).scalar_subquery().label('suppliers'),
+        select(func.count(PurchaseOrder.id)).scalar_subquery().label('purchases'),
+        select(func.count(SaleOrder.id)).scalar_subquery().label('sales'),
+        select(func.count(StockMovement.id)).scalar_subquery().label('movements'),
+        select(func.sum(Product.current_stock * Product.cost_price)).scalar_subquery().label('stock_value'),
+        select(func.count(Product.id)).where(Product.current_stock > 0).scalar_subquery().label('with_stock'),
+        select(func.count(Product.id)).where(Product.current_stock == 0).scalar_subquery().label('without_stock')
+    )).one()
     
     print(f"\n📊 Record Counts:")
-    print(f"   Products: {products_count}")
-    print(f"   Suppliers: {suppliers_count}")
-    print(f"   Purchase Orders: {purchases_count}")
-    print(f"   Sales: {sales_count}")
-    print(f"   Stock Movements: {movements_count}")
+    print(f"   Products: {stats.products}")
+    print(f"   Suppliers: {stats.suppliers}")
+    print(f"   Purchase Orders: {stats.purchases}")
+    print(f"   Sales: {stats.sales}")
+    print(f"   Stock Movements: {stats.movements}")
     
     # Sample data
     print(f"\n📦 Sample Products:")
@@ -42,17 +47,10 @@ def main():
         print(f"   - {supplier.name} ({supplier.tax_id})")
     
     # Stock statistics
-    total_stock_value = session.query(
-        func.sum(Product.current_stock * Product.cost_price)
-    ).scalar() or 0
-    
-    products_with_stock = session.query(Product).filter(Product.current_stock > 0).count()
-    products_without_stock = session.query(Product).filter(Product.current_stock == 0).count()
-    
     print(f"\n💰 Stock Statistics:")
-    print(f"   Total Stock Value: R$ {float(total_stock_value):,.2f}")
-    print(f"   Products with Stock: {products_with_stock}")
-    print(f"   Products without Stock: {products_without_stock}")
+    print(f"   Total Stock Value: R$ {float(stats.stock_value or 0):,.2f}")
+    print(f"   Products with Stock: {stats.with_stock}")
+    print(f"   Products without Stock: {stats.without_stock}")
     
     # Recent activity
     recent_sales = session.query(SaleOrder).order_by(